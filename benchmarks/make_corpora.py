@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+""" Generate the reference corpora in benchmarks/corpora.
+
+Problems are made with create() and reduce() from a fixed seed, and sorted by the
+techniques needed to solve them:
+
+    easy    naked and hidden singles only
+    logic   also locked candidates and subsets, but no fish
+    xwing   needs X-Wing, Swordfish or Jellyfish on top of the techniques above
+    search  still needs the search fallback
+
+The corpora start out with a few well known hard problems, fish examples and the
+examples used in tests/test_solvers.py. Problems equivalent to one already taken,
+by canonical form, are skipped so every corpus holds distinct problems. Only about
+one generated problem in 400 needs a fish, so filling the xwing corpus takes tens
+of thousands of attempts, well over half an hour; a corpus still short after that is
+left short rather than padded.
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), os.pardir ) )
+
+from sudoku import (
+    TECHNIQUES,
+    canonical_form,
+    create,
+    get_candidate_masks,
+    parse_problem,
+    propagate,
+    reduce,
+    solve,
+)
+
+CORPORA = os.path.join( os.path.dirname( __file__ ), 'corpora' )
+
+KNOWN = [
+    '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..',
+    '.......1.4.........2...........5.4.7..8...3....1.9....3..4..2...5.1........8.6...',
+    '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......',
+    '..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..',
+    '12.3....435....1....4........54..2..6...7.........8.9...31..5.......9.7.....6...8',
+    '.41729.3.769..34.2.3264.7194.39..17.6.7..49.319537..24214567398376.9.541958431267',
+    '98..62753.65..3...327.5...679..3.5...5...9...832.45..9673591428249.87..5518.2...7',
+    '.28..7....16.83.7.....2.85113729.......73........463.729..7.......86.14....3..7..',
+    '.3.....1...8.9....4..6.8......57694....98352....124...276..519....7.9....95...47.',
+    '1.....569492.561.8.561.924...964.8.1.64.1....218.356.4.4.5...169.5.614.2621.....5',
+    '2.......3.8..3..5...34.21....12.54......9......93.86....25.69...9..2..7.4.......1',
+    '16.543.7..786.14354358.76.172.458.696..912.57...376..4.16.3..4.3...8..16..71645.3',
+]
+
+# a Swordfish or Jellyfish can contain an X-Wing and make the same eliminations,
+# so the logic corpus is sorted without any of the fish.
+FISH = ( 'xwing', 'swordfish', 'jellyfish' )
+WITHOUT_FISH = tuple( technique for technique in TECHNIQUES if technique[0] not in FISH )
+
+
+def classify( problem ):
+    """ Return the name of the corpus problem belongs to. """
+
+    singles = list( problem )
+    if propagate( singles, get_candidate_masks( problem ) ) and 0 not in singles:
+        return 'easy'
+
+    def needs_search( techniques ):
+        stats = solve( problem, stats=True, techniques=techniques ).stats
+        return 'search' in stats.techniques
+
+    if not needs_search( WITHOUT_FISH ):
+        return 'logic'
+
+    if not needs_search( TECHNIQUES ):
+        return 'xwing'
+
+    return 'search'
+
+
+def main( size: int = 50, seed: int = 2024, max_attempts: int = 40000 ):
+    random.seed( seed )
+    rng = random.Random( seed )
+
+    corpora = { 'easy': [], 'logic': [], 'xwing': [], 'search': [] }
+    seen = set()
+
+    def add( problem ):
+        form = canonical_form( problem )
+        key = bytes( problem if form is None else form[0] )
+        if key in seen:
+            return
+
+        problems = corpora[ classify( problem ) ]
+        if len( problems ) < size:
+            problems.append( problem )
+            seen.add( key )
+
+    for line in KNOWN:
+        add( parse_problem( line ) )
+
+    attempts = 0
+    while any( len( problems ) < size for problems in corpora.values() ) and attempts < max_attempts:
+        attempts += 1
+        add( reduce( create( rng ) ) )
+
+    os.makedirs( CORPORA, exist_ok=True )
+    for name, problems in corpora.items():
+        with open( os.path.join( CORPORA, name + '.txt' ), 'w' ) as file_out:
+            file_out.write( "# {} problems, see make_corpora.py\n".format( name ) )
+            for problem in problems:
+                file_out.write( ''.join( map( str, problem ) ).replace( '0', '.' ) + '\n' )
+
+        print( "{:8} {:4} problems".format( name, len( problems ) ) )
+
+
+if __name__ == "__main__":
+    main()
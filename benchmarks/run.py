@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+""" Benchmark the solver and the generator.
+
+Every problem in the selected corpora is solved with solve_problem(), and grids are
+made with create(), attempt() and reduce(). For each benchmark the throughput, the
+50th and 99th percentile latency and the fraction of correct results is reported.
+Use --json to write the results in a machine readable form, to compare runs over
+time. The corpora are made by make_corpora.py.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert( 0, os.path.join( os.path.dirname( __file__ ), os.pardir ) )
+
+from sudoku import (
+    attempt,
+    count_solutions,
+    create,
+    is_solved,
+    iter_load,
+    reduce,
+    solve_problem,
+)
+
+CORPORA = os.path.join( os.path.dirname( __file__ ), 'corpora' )
+CORPUS_NAMES = ( 'easy', 'logic', 'xwing', 'search' )
+
+
+def percentile( values, fraction ):
+    """ Return value at fraction of the sorted values, using the nearest rank. """
+    values = sorted( values )
+    return values[ min( len( values ) - 1, int( fraction * len( values ) ) ) ]
+
+
+def measure( function, arguments, check ):
+    """ Call function once for each argument, and return the summary for the run.
+    Check is called with the argument and result to tell if the result is correct,
+    outside of the timing. """
+
+    latencies = []
+    correct = 0
+
+    for argument in arguments:
+        start = time.perf_counter()
+        result = function( argument )
+        latencies.append( time.perf_counter() - start )
+
+        correct += bool( check( argument, result ) )
+
+    total = sum( latencies )
+
+    return {
+        'count': len( latencies ),
+        'per_second': len( latencies ) / total if total else 0.0,
+        'p50_ms': percentile( latencies, 0.50 ) * 1000,
+        'p99_ms': percentile( latencies, 0.99 ) * 1000,
+        'correct': correct / len( latencies ),
+    }
+
+
+def solves( problem, solution ):
+    return is_solved( solution ) and all( cell == solution[index] for index, cell in enumerate( problem ) if cell )
+
+
+def run( corpora, limit, grids, seed ):
+    """ Run the benchmarks, and return a dictionary with the results. """
+
+    results = {}
+
+    for name in corpora:
+        problems = list( iter_load( os.path.join( CORPORA, name + '.txt' ) ) )[:limit]
+        results[ 'solve_problem/' + name ] = measure( solve_problem, problems, solves )
+
+    if grids:
+        random.seed( seed )
+        rng = random.Random( seed )
+
+        results['create'] = measure( lambda _: create( rng ), range( grids ), lambda _, grid: is_solved( grid ) )
+        results['create/shuffled'] = measure( lambda base: create( rng, base ), [ create( rng ) ] * grids, lambda _, grid: is_solved( grid ) )
+        results['attempt'] = measure( attempt, [ 1 ] * grids, lambda _, grid: is_solved( grid ) )
+
+        solutions = [ create( rng ) for _ in range( grids ) ]
+        results['reduce'] = measure(
+            reduce, solutions,
+            lambda solution, problem: count_solutions( problem ) == 1 and solves( problem, solution ),
+        )
+
+    return results
+
+
+def main( argv=None ):
+    parser = argparse.ArgumentParser( description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter )
+    parser.add_argument( '--corpus', nargs='*', choices=CORPUS_NAMES, default=list( CORPUS_NAMES ), help='corpora to solve' )
+    parser.add_argument( '--limit', type=int, default=None, help='problems to solve per corpus' )
+    parser.add_argument( '--grids', type=int, default=100, help='grids to generate, 0 skips the generator' )
+    parser.add_argument( '--seed', type=int, default=0 )
+    parser.add_argument( '--json', metavar='PATH', help='write results as json to PATH, - for stdout' )
+    args = parser.parse_args( argv )
+
+    results = run( args.corpus, args.limit, args.grids, args.seed )
+
+    if args.json:
+        report = {
+            'timestamp': time.strftime( '%Y-%m-%dT%H:%M:%S%z' ),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }
+
+        if args.json == '-':
+            json.dump( report, sys.stdout, indent=2 )
+            print()
+            return
+
+        with open( args.json, 'w' ) as file_out:
+            json.dump( report, file_out, indent=2 )
+
+    print( '{:24} {:>6} {:>10} {:>9} {:>9} {:>8}'.format( 'benchmark', 'count', 'per sec', 'p50 ms', 'p99 ms', 'correct' ) )
+    for name, result in results.items():
+        print( '{:24} {count:6} {per_second:10.1f} {p50_ms:9.2f} {p99_ms:9.2f} {correct:8.1%}'.format( name, **result ) )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,31 @@
+import mmap
 import random
+import struct
 from itertools import (
     combinations,
     chain,
+    groupby,
+    islice,
+    permutations,
+    product,
 )
-from collections import Counter
+from array import array
+from dataclasses import dataclass, field
+from functools import partial
+from time import perf_counter
+from collections import OrderedDict
 from collections.abc import Iterable
 from typing import (
+    Callable,
+    Dict,
+    Iterator,
     List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    Union,
 )
 
 DEBUG = False
@@ -21,42 +40,235 @@ def print_problem( problem: List[int] ):
 
 
 def save( path: str, problem: List[int] ):
-    """ Given a path to a file destination, save a list of 81 numbers 0 <= num <= 9. """
+    """ Given a path to a file destination, save a problem as written by
+    format_problem. """
 
     with open(path, 'w') as file_out:
-        file_out.write( ''.join( map(str, problem) ) )
+        file_out.write( format_problem( problem ) )
 
 
 def load( path: str ) -> List[int]:
-    """ Given a path to a file containing 81 numbers 0 <= num <= 9. Return a list 
-    for a sudoku problem. """
+    """ Given a path to a file containing a problem on one line, as read by
+    parse_problem. Return a list for a sudoku problem. """
 
     with open(path, 'r') as file_in:
-        problem = file_in.read().strip()
+        return parse_problem( file_in.read() )
 
-        # Return a list where each character is casted into an integer,
-        return [int(value) for value in problem]
 
+# Value for each character allowed in a problem.
+CELL_VALUES = { str(value): value for value in range(10) }
+CELL_VALUES['.'] = 0
 
-def attempt( max_tries: int ) -> List[int]:
-    """ Attempt creating a sudoku problem with a limited amount of attempts. """
+
+def parse_problem( line: str ) -> List[int]:
+    """ Parse a problem written as 81 characters, using 0 or . for empty cells. Lines of
+    16, 256 or 625 characters are parsed as 4x4, 16x16 or 25x25 problems, with the
+    values past 9 written as the letters of ALPHABET. """
+
+    line = line.strip()
+    if len(line) == 81:
+        symbols = CELL_VALUES
+    elif len(line) in ( 16, 256, 625 ):
+        symbols = grid_geometry( line ).symbols
+    else:
+        raise ValueError( "Expected 16, 81, 256 or 625 cells, got {}".format( len(line) ) )
+
+    try:
+        return [ symbols[value] for value in line ]
+    except KeyError:
+        raise ValueError( "Invalid character in problem {!r}".format( line ) ) from None
+
+
+def format_problem( problem: List[int], style: str = 'line' ) -> str:
+    """ Format a problem as a line of 81 characters with '.' for empty cells, or as a
+    grid of nine lines followed by an empty line. Values past 9 in larger grids are
+    written as the letters of ALPHABET. """
+
+    line = ''.join( ALPHABET[ value - 1 ] if value else '.' for value in problem )
+    if style == 'grid':
+        size = grid_geometry( problem ).size
+        return '\n'.join( line[start:start + size] for start in range( 0, len( line ), size ) ) + '\n'
+    return line
+
+
+def iter_lines( file_in: TextIO ) -> Iterator[Tuple[int, str]]:
+    """ Yield line number and problem for each line of file_in holding a problem. Blank
+    lines and lines starting with # are skipped, and only the first field of a line is
+    kept so ratings or names following the problem are ignored. """
+
+    for number, line in enumerate( file_in, 1 ):
+        fields = line.split()
+        if fields and not fields[0].startswith( '#' ):
+            yield number, fields[0]
+
+
+def iter_load( path: str ) -> Iterator[List[int]]:
+    """ Given a path to a file with one problem per line, yield each problem. The file is
+    read line by line, so it can be larger than memory. Raises a ValueError with the
+    line number for any malformed problem. """
+
+    with open(path, 'r') as file_in:
+        for number, line in iter_lines( file_in ):
+            try:
+                yield parse_problem( line )
+            except ValueError as error:
+                raise ValueError( "{}:{}: {}".format( path, number, error ) ) from None
+
+
+def save_many( path: str, problems: Iterable[List[int]] ) -> int:
+    """ Given a path to a file destination, save each problem on its own line and
+    return the number of problems written. Problems are consumed one at a time. """
 
     count = 0
-    problem = list()
 
-    for _ in range( max_tries ):
-        try:
-            problem = create()
-            break
-        except IndexError:
-            # Index errors can be expected, seeing as in create() we attempt picking a random
-            # value from a list, and if a faulty sudoku was made, there won't be any values
-            # in the list we're looking to pick values from.
+    with open(path, 'w') as file_out:
+        for problem in problems:
+            file_out.write( format_problem( problem ) )
+            file_out.write( '\n' )
             count += 1
 
+    return count
+
+
+# Binary problem store
+#
+# Problems packed two cells per byte, 41 bytes per problem, after a 16 byte header
+# holding a magic string, the format version, the record size and the number of
+# problems. Files are read through mmap so any problem can be fetched in O(1), and
+# several processes reading the same file share its pages.
+
+STORE_MAGIC = b'SDKU'
+STORE_VERSION = 1
+STORE_HEADER = struct.Struct( '<4sHHQ' )
+RECORD_SIZE = 41
+
+# High and low nibble of every byte.
+NIBBLES = tuple( ( byte >> 4, byte & 0xf ) for byte in range(256) )
+
+
+def pack_problem( problem: List[int] ) -> bytes:
+    """ Pack a problem of 81 values into 41 bytes. Raise ValueError for problems of
+    other sizes, which the store does not hold. """
+    if len( problem ) != 81:
+        raise ValueError( "Binary stores only hold 9x9 problems, got {} cells".format( len( problem ) ) )
+    cells = list( problem ) + [0]
+    return bytes( cells[index] << 4 | cells[index + 1] for index in range(0, 82, 2) )
+
+
+def unpack_problem( data: bytes ) -> List[int]:
+    """ Unpack 41 bytes made by pack_problem into a problem. """
+    problem = list( chain.from_iterable( map( NIBBLES.__getitem__, data ) ) )
+    del problem[81:]
     return problem
 
 
+def write_store( path: str, problems: Iterable[List[int]] ) -> int:
+    """ Write problems to a binary store at path, and return the number of problems
+    written. Problems are consumed one at a time and the count in the header is
+    filled in at the end. """
+
+    count = 0
+
+    with open(path, 'wb') as file_out:
+        file_out.write( STORE_HEADER.pack( STORE_MAGIC, STORE_VERSION, RECORD_SIZE, 0 ) )
+
+        for problem in problems:
+            try:
+                file_out.write( pack_problem( problem ) )
+            except ValueError as error:
+                raise ValueError( "problem {}: {}".format( count + 1, error ) ) from None
+            count += 1
+
+        file_out.seek(0)
+        file_out.write( STORE_HEADER.pack( STORE_MAGIC, STORE_VERSION, RECORD_SIZE, count ) )
+
+    return count
+
+
+class PuzzleStore:
+    """ Read only, memory mapped view of a binary store written by write_store.
+
+    Indexing with an integer returns a problem, and slicing returns a list of
+    problems. Pickling a store only sends its path, so it can be handed to worker
+    processes which then map the same file. """
+
+    def __init__( self, path: str ):
+        self.path = path
+        self._file = open(path, 'rb')
+
+        header = self._file.read( STORE_HEADER.size )
+        if len( header ) != STORE_HEADER.size:
+            self._file.close()
+            raise ValueError( "{} is too short to be a problem store".format( path ) )
+
+        magic, version, record_size, count = STORE_HEADER.unpack( header )
+        if magic != STORE_MAGIC or version != STORE_VERSION or record_size != RECORD_SIZE:
+            self._file.close()
+            raise ValueError( "{} is not a version {} problem store".format( path, STORE_VERSION ) )
+
+        self._count = count
+        self._map = mmap.mmap( self._file.fileno(), 0, access=mmap.ACCESS_READ )
+
+        if len( self._map ) < STORE_HEADER.size + count * RECORD_SIZE:
+            self.close()
+            raise ValueError( "{} is truncated".format( path ) )
+
+    def __len__( self ) -> int:
+        return self._count
+
+    def __getitem__( self, key: Union[int, slice] ):
+        if isinstance( key, slice ):
+            return [ self[index] for index in range( *key.indices( self._count ) ) ]
+
+        if key < 0:
+            key += self._count
+        if not 0 <= key < self._count:
+            raise IndexError( "problem index out of range" )
+
+        start = STORE_HEADER.size + key * RECORD_SIZE
+        return unpack_problem( self._map[ start : start + RECORD_SIZE ] )
+
+    def __iter__( self ) -> Iterator[List[int]]:
+        for index in range( self._count ):
+            yield self[index]
+
+    def __enter__( self ):
+        return self
+
+    def __exit__( self, *args ):
+        self.close()
+
+    def __getstate__( self ):
+        return self.path
+
+    def __setstate__( self, path ):
+        self.__init__( path )
+
+    def close( self ):
+        self._map.close()
+        self._file.close()
+
+
+def text_to_store( source: str, destination: str ) -> int:
+    """ Convert a text file with one problem per line to a binary store. """
+    return write_store( destination, iter_load( source ) )
+
+
+def store_to_text( source: str, destination: str ) -> int:
+    """ Convert a binary store to a text file with one problem per line. """
+    with PuzzleStore( source ) as store:
+        return save_many( destination, store )
+
+
+def attempt( max_tries: int ) -> List[int]:
+    """ Attempt creating a sudoku problem with a limited amount of attempts.
+
+    Kept for backwards compatibility, create() no longer fails so the first
+    attempt is always returned. """
+
+    return create()
+
+
 def remove_candidates( value: int, candidates: List[List[int]], indices: Iterable[int] ) -> int:
     """ Remove value from candidates for given indices. """
     count = 0
@@ -71,82 +283,280 @@ def remove_candidates( value: int, candidates: List[List[int]], indices: Iterabl
     return count
 
 
-def create() -> List[int]:
-    """ Generate a new sudoku puzzle. """
+def create( rng: random.Random = random, base: List[int] = None ) -> List[int]:
+    """ Generate a new sudoku solution in a single pass.
 
-    problem = list()
+    The three boxes on the diagonal share no row or column, so they are filled with
+    random permutations of 1 through 9 and the rest is completed by search, which
+    always succeeds. The grid is then shuffled through the symmetries of the grid so
+    the cells filled by search don't follow a fixed pattern.
 
-    # Generate a list for each cell with all available values.
-    candidates = [ [ candidate for candidate in range(1, 10) ] for _ in range(81) ]
+    If a base solution is given, it is shuffled instead of searching for a new one.
+    That is an order of magnitude faster, but every grid is then equivalent to base. """
 
-    # Initialize a pool of values we can choose from.
-    values = [x for x in range(1,10)] * 9
+    if base is not None:
+        return shuffle( base, rng )
 
-    indices = [ x for x in range(81) ]
+    problem = [0] * 81
 
-    # Iterate over each index in a sudoku problem
-    for index in indices:
+    for box in ( BOXES[0], BOXES[4], BOXES[8] ):
+        for index, value in zip( box, rng.sample( range(1, 10), 9 ) ):
+            problem[index] = value
 
-        # intersection of candidates and values
-        value = random.choice(list(set(candidates[index]) & set(values)))
+    solution = next( _search( SolverState.from_problem( problem ) ) )
 
-        # Remove value from pool of values,
-        values.remove(value)
+    return shuffle( list( solution ), rng )
 
-        problem.append(value)
 
-        # Get indices for row, column and box, and run a set union to get all
-        # unique indices we must purge value from.
-        row_indices = set(get_row( which_row(index), indices))
-        column_indices = set(get_column( which_column(index), indices))
-        box_indices = set(get_box( which_box(index), indices))
+def shuffle( problem: List[int], rng: random.Random = random ) -> List[int]:
+    """ Return a random problem equivalent to problem. Digits are relabeled, bands and
+    stacks swapped, rows and columns swapped within their band or stack, and the grid
+    is possibly transposed. """
 
-        remove_candidates(
-            value, 
-            candidates, 
-            list(row_indices|column_indices|box_indices)
-        )
+    rows = [ band * 3 + row for band in rng.sample( range(3), 3 ) for row in rng.sample( range(3), 3 ) ]
+    columns = [ stack * 3 + column for stack in rng.sample( range(3), 3 ) for column in rng.sample( range(3), 3 ) ]
+    digits = [0] + rng.sample( range(1, 10), 9 )
 
-    return problem
+    if rng.random() < 0.5:
+        return [ digits[ problem[ row * 9 + column ] ] for column in columns for row in rows ]
 
+    return [ digits[ problem[ row * 9 + column ] ] for row in rows for column in columns ]
 
-def is_ambiguous( problem ):
-    """ Check if there are more than one solution to the current problem. """
 
-    # FIXME: not really sure this function works
+def canonical_form( problem: List[int] ) -> Optional[Tuple[List[int], Tuple[int, ...], List[int]]]:
+    """ Return the canonical form of problem under the symmetries used by shuffle, along
+    with the transform taking problem to it: cell i of the canonical form is cells[i]
+    of problem, with its value relabeled through digits. Equivalent problems share the
+    same canonical form.
+
+    The canonical form is the smallest grid in row major order, first comparing where
+    the values are set, then the values once relabeled in order of appearance. Rows
+    are picked one at a time, keeping only the row orders whose best arrangement of
+    columns gives the smallest pattern so far. For a given row order the best
+    arrangement sorts the columns within each stack, and then the stacks. Only
+    columns and stacks tied in that sort are then tried for the values.
+
+    Nearly full or nearly empty patterns leave thousands of row orders and column
+    arrangements tied, which would take far longer to compare than solving the
+    problem. Once more than CANONICAL_LIMIT row orders would be scored at one depth,
+    or arrangements compared in the end, None is returned instead. The number of
+    ties is the same for equivalent problems, so either all of them get the same
+    canonical form or none do. """
+
+    # Partial row orders as ( transposed, rows, column vectors, bits ), where the column
+    # vectors hold the pattern of each column over the rows picked so far.
+    states = []
+    for transposed in ( False, True ):
+        bits = [ [ 1 if problem[ column * 9 + row if transposed else row * 9 + column ] else 0 for column in range(9) ] for row in range(9) ]
+        states.extend( ( transposed, ( row, ), bits[row], bits ) for row in range(9) )
+
+    for depth in range(1, 10):
+
+        if depth > 1:
+            extended = []
+            for transposed, rows, vectors, bits in states:
+                if len( rows ) % 3:
+                    band = rows[-1] // 3
+                    choices = [ row for row in range( band * 3, band * 3 + 3 ) if row not in rows ]
+                else:
+                    bands = { row // 3 for row in rows }
+                    choices = [ row for row in range(9) if row // 3 not in bands ]
+
+                for row in choices:
+                    extended.append( ( transposed, rows + ( row, ), [ vector << 1 | bit for vector, bit in zip( vectors, bits[row] ) ], bits ) )
+            states = extended
+
+            if len( states ) > CANONICAL_LIMIT:
+                return None
+
+        scores = [ _pattern_score( vectors, depth ) for _, _, vectors, _ in states ]
+        lowest = min( scores )
+        states = [ state for state, score in zip( states, scores ) if score == lowest ]
+
+    best = None
+    compared = 0
+
+    for transposed, rows, vectors, _ in states:
+        for columns in _column_arrangements( vectors ):
+
+            cells = tuple(
+                column * 9 + row if transposed else row * 9 + column
+                for row in rows for column in columns
+            )
+
+            # Relabel values in order of appearance,
+            digits = [0] * 10
+            label = 0
+            for index in cells:
+                value = problem[index]
+                if value and not digits[value]:
+                    label += 1
+                    digits[value] = label
+
+            canonical = [ digits[ problem[index] ] for index in cells ]
+            if best is None or canonical < best[0]:
+                best = ( canonical, cells, digits )
+
+            compared += 1
+            if compared > CANONICAL_LIMIT:
+                return None
+
+    canonical, cells, digits = best
+
+    # Values missing from problem get the remaining labels in order,
+    label = max( digits )
+    for value in range(1, 10):
+        if not digits[value]:
+            label += 1
+            digits[value] = label
+
+    return canonical, cells, digits
+
+
+# Tied row orders or column arrangements beyond which canonical_form gives up. The
+# problems in the benchmark corpora stay under 40.
+CANONICAL_LIMIT = 128
+
+
+def _stack_order( vectors: List[int], depth: int ) -> List[Tuple[int, List[int]]]:
+    """ Sort columns within each stack by their vectors, and return ( key, columns ) for
+    the stacks sorted by key, which holds the 3 bit chunks of the stack row by row. """
+
+    stacks = []
+    for stack in range(3):
+        columns = sorted( range( stack * 3, stack * 3 + 3 ), key=vectors.__getitem__ )
+
+        key = 0
+        for shift in range( depth - 1, -1, -1 ):
+            for column in columns:
+                key = key << 1 | vectors[column] >> shift & 1
+
+        stacks.append( ( key, columns ) )
+
+    stacks.sort( key=lambda stack: stack[0] )
+
+    return stacks
+
 
-    # A problem must have at least eight digits to not be ambiguous
-    if len(set(problem)) < 8:
+def _pattern_score( vectors: List[int], depth: int ) -> int:
+    """ Return the pattern of the rows picked so far, under the best arrangement of the
+    columns, as an integer with the first row in the highest bits. """
+
+    stacks = _stack_order( vectors, depth )
+
+    score = 0
+    for row in range( depth ):
+        shift = 3 * ( depth - 1 - row )
+        for key, _ in stacks:
+            score = score << 3 | key >> shift & 7
+
+    return score
+
+
+def _column_arrangements( vectors: List[int] ) -> Iterator[List[int]]:
+    """ Yield every arrangement of columns giving the best pattern for the complete
+    column vectors, by permuting columns and stacks tied in the sort. """
+
+    def tied_orders( items, key ):
+        groups = [ list( group ) for _, group in groupby( items, key=key ) ]
+        for orders in product( *( permutations( group ) for group in groups ) ):
+            yield [ item for order in orders for item in order ]
+
+    stacks = _stack_order( vectors, 9 )
+
+    for stack_order in tied_orders( stacks, key=lambda stack: stack[0] ):
+        within = [ list( tied_orders( columns, key=vectors.__getitem__ ) ) for _, columns in stack_order ]
+        for orders in product( *within ):
+            yield [ column for order in orders for column in order ]
+
+
+def count_solutions( problem: List[int], limit: int = 2, masks: array = None, workers: int = None ) -> int:
+    """ Count solutions to problem, stopping as soon as limit solutions are found. Pass
+    limit=None to count all of them. Candidate masks for problem may be given to
+    start the search from. If workers is given, the search is split over that many
+    processes and the counts of every part added up, see parallel_solutions. """
+
+    if workers is not None:
+        return len( parallel_solutions( problem, limit, masks, workers ) )
+
+    return sum( 1 for _ in islice( iter_solutions( problem, masks ), limit ) )
+
+
+def is_ambiguous( problem ):
+    """ Check if there are more than one solution to the current problem. The problem
+    is assumed to have at least one solution. """
+
+    # A problem must have all its digits but one to not be ambiguous,
+    if len( set( problem ) - {0} ) < grid_geometry( problem ).size - 1:
         return True
 
-    # Also read that if 17 values or less are set, it will be ambiguous
-    if (81 - problem.count(0)) <= 17:
+    # and a 9x9 problem at least 17 values set.
+    if len( problem ) == 81 and (81 - problem.count(0)) < 17:
         return True
 
-    return False
+    return count_solutions( problem, limit=2 ) > 1
+
 
+def reduce( solution: List[int], rng: random.Random = random, min_clues: int = 0 ) -> List[int]:
+    """ Take a sudoku solution, and hide values in cells as long as the problem keeps
+    a unique solution. Cells are visited in random order, and a value is kept if hiding
+    it would make the problem ambiguous, so the result is a minimal problem. Hiding
+    stops early once only min_clues values are left, in which case the problem may
+    not be minimal. """
 
-def reduce( solution ):
-    """ Take a sudoku solution, and hide values in cells untill
-    problem turns ambigous. """
+    grid = grid_geometry( solution )
+    all_candidates, cell_unit_ids, peers = grid.all_candidates, grid.cell_unit_ids, grid.peers
 
-    # TODO: this reduce solutions too much making the sudoku ambiguous
+    state = SolverState( bytearray( solution ), grid.empty_masks(), grid )
+    values, masks = state.values, state.candidates
+    clues = len( solution )
 
-    problem = [value for value in solution]
+    # Values set in each unit, kept up to date as values are hidden. The candidates of
+    # every empty cell are always those left by the units, so hiding or restoring a
+    # value only changes the candidates of the cell and its peers.
+    used = [ all_candidates ] * len( grid.units )
 
     # List indices for cells we will step through
-    indices = [ x for x in range(81) ]
-    random.shuffle(indices)
+    indices = list( grid.indices )
+    rng.shuffle(indices)
 
     for index in indices:
-        tmp = problem.copy()
-        tmp[index] = 0
-        if is_ambiguous(tmp):
-            return problem
-
-        problem = tmp
+        if clues <= min_clues:
+            break
 
-    return problem
+        value = values[index]
+        bit = value_to_bit( value )
+
+        values[index] = 0
+        for unit in cell_unit_ids[index]:
+            used[unit] &= ~bit
+
+        row, column, box = cell_unit_ids[index]
+        masks[index] = all_candidates & ~( used[row] | used[column] | used[box] )
+        for peer in peers[index]:
+            row, column, box = cell_unit_ids[peer]
+            if not values[peer] and not ( used[row] | used[column] | used[box] ) & bit:
+                masks[peer] |= bit
+
+        # The problem already has a unique solution with value at index, so any other
+        # solution must have a different value there. Exclude value and look for one,
+        # then roll the search back.
+        mark = state.mark()
+        state.eliminate( index, bit )
+        ambiguous = next( _search( state ), None ) is not None
+        state.undo( mark )
+
+        if ambiguous:
+            values[index] = value
+            masks[index] = 0
+            for unit in cell_unit_ids[index]:
+                used[unit] |= bit
+            for peer in peers[index]:
+                masks[peer] &= ~bit
+        else:
+            clues -= 1
+
+    return state.to_problem()
 
 
 def which_row( index ):
@@ -181,32 +591,204 @@ def get_column( column, problem ):
 
 def get_box( box, problem ):
     """ Return box of a sudoku problem. """
+    return [ problem[index] for index in BOXES[ box - 1 ] ]
 
-    cells = list()
 
-    for index, cell in enumerate(problem):
-        if ((index % 9 // 3 + 1) + (index // 27 * 3) ) == box:
-            cells.append(cell)
+# Symbols for the values of grids up to 25x25, value n being ALPHABET[n - 1].
+ALPHABET = '123456789ABCDEFGHIJKLMNOP'
+
+
+class _SplitPopcount:
+    """ Number of set bits of masks too wide for a table over every mask, looked up
+    16 bits at a time. Indexed like the tables of narrower grids. """
+
+    __slots__ = ( 'table', )
+
+    def __init__( self, table: Sequence[int] ):
+        self.table = table
+
+    def __getitem__( self, mask: int ) -> int:
+        return self.table[ mask & 0xffff ] + self.table[ mask >> 16 ]
+
+
+class Geometry:
+    """ Unit tables for grids made of box x box boxes, so with box * box values and
+    rows, built once per box size by geometry(). Every technique working on masks
+    looks up the geometry of its grid from the number of cells, through
+    grid_geometry(). The tables are described with the module level aliases for
+    the 9x9 grid below. """
+
+    __slots__ = (
+        'box', 'size', 'cells', 'indices', 'digits', 'rows', 'columns', 'boxes', 'units',
+        'cell_units', 'cell_unit_ids', 'peers', 'intersections', 'intersection_unit_ids',
+        'all_units', 'cell_unit_bits', 'all_candidates', 'typecode', 'popcount', 'symbols',
+    )
+
+    def __init__( self, box: int ):
+        size = box * box
+
+        self.box = box
+        self.size = size
+        self.cells = size * size
+        self.indices = tuple( range( self.cells ) )
+        self.digits = set( range( 1, size + 1 ) )
 
-    return cells
+        self.rows = tuple( tuple( range( row * size, ( row + 1 ) * size ) ) for row in range( size ) )
+        self.columns = tuple( tuple( range( column, self.cells, size ) ) for column in range( size ) )
+        self.boxes = tuple(
+            tuple(
+                ( band * box + row ) * size + stack * box + column
+                for row in range( box ) for column in range( box )
+            )
+            for band in range( box ) for stack in range( box )
+        )
+        self.units = self.rows + self.columns + self.boxes
+
+        def box_of( index ):
+            row, column = divmod( index, size )
+            return row // box * box + column // box
+
+        self.cell_unit_ids = tuple(
+            ( index // size, size + index % size, 2 * size + box_of( index ) ) for index in self.indices
+        )
+        self.cell_units = tuple(
+            tuple( self.units[unit] for unit in unit_ids ) for unit_ids in self.cell_unit_ids
+        )
+        self.peers = tuple(
+            tuple( sorted( set( chain( *self.cell_units[index] ) ) - { index } ) ) for index in self.indices
+        )
+
+        lines = self.rows + self.columns
+        self.intersections = tuple(
+            (
+                tuple( sorted( set( box_cells ) & set( line ) ) ),
+                tuple( sorted( set( box_cells ) - set( line ) ) ),
+                tuple( sorted( set( line ) - set( box_cells ) ) ),
+            )
+            for box_cells in self.boxes
+            for line in lines
+            if set( box_cells ) & set( line )
+        )
+        self.intersection_unit_ids = tuple(
+            ( 2 * size + box_id, line_id )
+            for box_id, box_cells in enumerate( self.boxes )
+            for line_id, line in enumerate( lines )
+            if set( box_cells ) & set( line )
+        )
+
+        self.all_units = ( 1 << len( self.units ) ) - 1
+        self.cell_unit_bits = tuple( sum( 1 << unit for unit in unit_ids ) for unit_ids in self.cell_unit_ids )
+
+        # candidates of 16x16 grids still fit in 16 bits, wider grids need 32 bits,
+        self.all_candidates = ( 1 << size ) - 1
+        self.typecode = 'H' if size <= 16 else 'L'
+
+        if size <= 16:
+            self.popcount = tuple( bin( mask ).count( '1' ) for mask in range( self.all_candidates + 1 ) )
+        else:
+            self.popcount = _SplitPopcount( geometry( 4 ).popcount )
+
+        self.symbols = { '.': 0, '0': 0 }
+        for value, symbol in enumerate( ALPHABET[:size], 1 ):
+            self.symbols[symbol] = value
+            self.symbols[symbol.lower()] = value
+
+    def __repr__( self ) -> str:
+        return "Geometry({})".format( self.box )
+
+    def __reduce__( self ):
+        return geometry, ( self.box, )
+
+    def empty_masks( self ) -> array:
+        """ Return an array of masks without any candidates for every cell. """
+        return array( self.typecode, [0] ) * self.cells
+
+
+# Geometries built so far, by box size and by number of cells.
+_GEOMETRIES = {}
+_GEOMETRIES_BY_CELLS = {}
+
+
+def geometry( box: int = 3 ) -> Geometry:
+    """ Return the geometry of grids with boxes of box x box cells, building it on first
+    use. Box sizes 2 to 5 give 4x4, 9x9, 16x16 and 25x25 grids. """
+
+    try:
+        return _GEOMETRIES[box]
+    except KeyError:
+        pass
+
+    if not 2 <= box <= 5:
+        raise ValueError( "Unsupported box size {}".format( box ) )
+
+    built = Geometry( box )
+    _GEOMETRIES[box] = _GEOMETRIES_BY_CELLS[built.cells] = built
+
+    return built
+
+
+def grid_geometry( grid: Sequence ) -> Geometry:
+    """ Return the geometry of a problem or masks, from its number of cells. """
+
+    try:
+        return _GEOMETRIES_BY_CELLS[ len( grid ) ]
+    except KeyError:
+        pass
+
+    box = round( len( grid ) ** 0.25 )
+    if box ** 4 != len( grid ):
+        raise ValueError( "Expected a square number of cells, got {}".format( len( grid ) ) )
+
+    return geometry( box )
+
+
+# Unit tables for the 9x9 grid built once at import, every technique below looks up
+# indices in these, or in the geometry of its grid, instead of slicing or scanning a
+# freshly built list of indices. Indices are 0 based, whereas the row, column and
+# box numbers used by the functions above are 1 based.
+GEOMETRY = geometry( 3 )
+
+INDICES = GEOMETRY.indices
+DIGITS = GEOMETRY.digits
+
+ROWS = GEOMETRY.rows
+COLUMNS = GEOMETRY.columns
+BOXES = GEOMETRY.boxes
+
+# All 27 units, rows first followed by columns and boxes.
+UNITS = GEOMETRY.units
+
+# Units each cell belongs to, ordered as row, column and box.
+CELL_UNITS = GEOMETRY.cell_units
+
+# Position in UNITS of the row, column and box for each cell.
+CELL_UNIT_IDS = GEOMETRY.cell_unit_ids
+
+# The 20 cells sharing a unit with each cell.
+PEERS = GEOMETRY.peers
+
+# For every box and every row/column crossing it, store a tuple with the indices in
+# the overlap, the indices in the box outside the overlap, and the indices in the
+# row/column outside the overlap. Used by the locked candidates techniques.
+INTERSECTIONS = GEOMETRY.intersections
+
+# Position in UNITS of the box and the row/column for each entry in INTERSECTIONS.
+INTERSECTION_UNIT_IDS = GEOMETRY.intersection_unit_ids
+
+# Units as a bitmask with bit n set for UNITS[n], for all units and the units of each cell.
+ALL_UNITS = GEOMETRY.all_units
+CELL_UNIT_BITS = GEOMETRY.cell_unit_bits
 
 
 def get_candidates( index, problem ):
     """ Given the index of a cell in problem, find all candidates for 
     cell at index. """
 
-    # Find which row, column and box index is associated with.
-    row = which_row( index )
-    column = which_column( index )
-    box = which_box( index )
-
     # Create a set with values 1 through 9
     candidates = set([num for num in range( 1, 10 )])
 
-    # Find all values in row, column and box using set union
-    values = set(get_row( row, problem )) |\
-             set(get_column( column, problem )) |\
-             set(get_box( box, problem ))
+    # Find all values in row, column and box by looking at the peers of index
+    values = { problem[peer] for peer in PEERS[index] }
 
     return list(candidates - values)
 
@@ -270,36 +852,18 @@ def solve_hidden_singles( problem: List[int], candidates: List[List[int]] =[] )
     if not candidates:
         candidates = get_all_candidates( problem )
 
-    # For each row,
-    for row in range(1, 10):
-        # Get candidates and indices for row,
-        row_candidates = get_row( row, candidates )
-        row_indices = get_row( row, [x for x in range(81)] )
+    # For each row, column and box,
+    for unit in UNITS:
+        # Get candidates for unit,
+        unit_candidates = [ candidates[index] for index in unit ]
 
         # Get list of hidden singles,
-        hidden_singles = hidden_singles_in_section( row_candidates )
+        hidden_singles = hidden_singles_in_section( unit_candidates )
 
         # If there is a hidden single, we must iterate over each and 
         # find the value and index to set for our problem.
         for value in hidden_singles:
-            for cell_candidates, index in zip(row_candidates, row_indices):
-
-                if value in cell_candidates:
-                    problem[index] = value
-                    solved_cells += 1
-                    if DEBUG:
-                        print("Solved a hidden single at r{}c{}".format(which_row(index), which_column(index)))
-
-    # Do same for other sections, could use some refactoring...
-    for column in range(1, 10):
-
-        column_candidates = get_column( column, candidates )
-        column_indices = get_column( column, [x for x in range(81)] )
-
-        hidden_singles = hidden_singles_in_section( column_candidates )
-
-        for value in hidden_singles:
-            for cell_candidates, index in zip(column_candidates, column_indices):
+            for cell_candidates, index in zip(unit_candidates, unit):
 
                 if value in cell_candidates:
                     problem[index] = value
@@ -307,22 +871,6 @@ def solve_hidden_singles( problem: List[int], candidates: List[List[int]] =[] )
                     if DEBUG:
                         print("Solved a hidden single at r{}c{}".format(which_row(index), which_column(index)))
 
-    for box in range(1, 10):
-
-        box_candidates = get_box( box, candidates )
-        box_indices = get_box( box, [x for x in range(81)] )
-        
-        hidden_singles = hidden_singles_in_section( box_candidates )
-
-        for value in hidden_singles:
-            for cell_candidates, index in zip(box_candidates, box_indices):
-
-                if value in cell_candidates:
-                    problem[index] = value
-                    solved_cells += 1
-                    if DEBUG: 
-                        print("Solved a hidden single at r{}c{}".format(which_row(index), which_column(index)))
-
     return solved_cells
 
 
@@ -340,314 +888,2084 @@ def eliminate_locked_candidates_pointing( candidates: List[List[int]] = [] ) ->
 
     count = 0
 
-    indices = [ index for index in range(81) ]
+    for overlap, box_exclusive, line_exclusive in INTERSECTIONS:
+
+        # Get candidates in the overlap,
+        overlap_candidates = { candidate for index in overlap for candidate in candidates[index] }
+
+        # Get candidates outside of overlap,
+        box_exclusive_candidates = { candidate for index in box_exclusive for candidate in candidates[index] }
 
-    for box in range(1, 10):
+        # Get which candidates are in overlap but not in the rest of box,
+        for candidate in (overlap_candidates - box_exclusive_candidates):
+            # and remove these from the non-overlapping section
+            count += remove_candidates( candidate, candidates, line_exclusive )
 
-        box_indices = get_box( box, indices )
+    return count
 
-        # Get overlapping rows,
-        overlapping_rows = { which_row(index) for index in box_indices }
 
-        # For each row overlapping with current box,
-        for row in overlapping_rows:
+def eliminate_locked_candidates_claiming( candidates ) -> int:
 
-            # get indices for row, 
-            row_indices = get_row( row, indices )
+    count = 0
 
-            # get indices where row & box overlaps, 
-            box_row_indices = set( box_indices ) & set( row_indices )
+    for overlap, box_exclusive, line_exclusive in INTERSECTIONS:
 
-            # get indices unique to box,
-            box_indices_excluding_row = set( box_indices ) - set( row_indices )
+        overlapping_candidates = { candidate for index in overlap for candidate in candidates[index] }
+        line_exclusive_candidates = { candidate for index in line_exclusive for candidate in candidates[index] }
 
-            # get indices unique to row,
-            row_indices_excluding_box = set( row_indices ) - set( box_indices )
+        for candidate in ( overlapping_candidates - line_exclusive_candidates ):
+            count += remove_candidates( candidate, candidates, box_exclusive )
 
-            # Get candidates in the overlap,
-            box_row_candidates = { candidate for index in box_row_indices for candidate in candidates[index] }
+    return count
 
-            # Get candidates outside of overlap,
-            box_excluding_row_candidates = { candidate for index in box_indices_excluding_row for candidate in candidates[index] }
 
-            # Get which candidates are in overlap but not in the rest of box,
-            for candidate in (box_row_candidates - box_excluding_row_candidates):
-                # and remove these from the non-overlapping section
-                count += remove_candidates( candidate, candidates, row_indices_excluding_box )
+def hidden_subset( candidates, section_indices, depth ) -> int:
+    """ List candidates version of hidden_subset_masks. """
+    return apply_to_candidates( hidden_subset_masks, candidates, section_indices, depth )
 
-        # Same as above but going over columns this time,
-        overlapping_columns = { which_column(index) for index in box_indices }
 
-        for column in overlapping_columns:
+def naked_subset( candidates, section_indices, depth ) -> int:
+    """ List candidates version of naked_subset_masks. """
+    return apply_to_candidates( naked_subset_masks, candidates, section_indices, depth )
 
-            column_indices = get_column( column, indices )
 
-            box_column_indices = set( box_indices ) & set( column_indices )
-            box_indices_excluding_column = set( box_indices ) - set( column_indices )
-            column_indices_excluding_box = set( column_indices ) - set( box_indices )
+def xwing(candidates: List[List[int]]) -> int:
+    """ List candidates version of xwing_masks. """
+    return apply_to_candidates( xwing_masks, candidates )
 
-            box_column_candidates = { candidate for index in box_column_indices for candidate in candidates[index] }
-            box_excluding_column_candidates = { candidate for index in box_indices_excluding_column for candidate in candidates[index] }
 
-            for candidate in (box_column_candidates - box_excluding_column_candidates):
-                count += remove_candidates( candidate, candidates, column_indices_excluding_box )
+# Bitmask candidates
+#
+# Alternative candidate store where each cell holds a 9 bit integer, bit n - 1 being
+# set when n is a candidate for the cell. Solved cells hold an empty mask. The
+# techniques below mirror the list based ones above but work on the masks in place.
 
-    return count
+ALL_CANDIDATES = GEOMETRY.all_candidates
 
+# Number of set bits for every possible mask.
+POPCOUNT = GEOMETRY.popcount
 
-def eliminate_locked_candidates_claiming( candidates ) -> int:
 
-    count = 0
+def value_to_bit( value: int ) -> int:
+    """ Return the bit representing value. """
+    return 1 << ( value - 1 )
 
-    indices = [ index for index in range(81) ]
 
-    for row in range(1, 10):
-        row_indices = get_row( row, indices )
-        row_candidates = get_row( row, candidates )
+def bit_to_value( bit: int ) -> int:
+    """ Return the value represented by a single bit. """
+    return bit.bit_length()
 
-        overlapping_boxes = { which_box( index ) for index in row_indices }
 
-        for box in overlapping_boxes:
+def lowest_bit( mask: int ) -> int:
+    """ Return the lowest set bit of mask. """
+    return mask & -mask
 
-            box_indices = get_box( box, indices )
 
-            overlapping_indices = set( row_indices ) & set( box_indices )
-            box_exlusive = set( box_indices ) - set( row_indices )
-            row_exlusive = set( row_indices ) - set( box_indices )
+def popcount( mask: int ) -> int:
+    """ Return number of candidates in mask. """
+    return POPCOUNT[mask] if mask <= ALL_CANDIDATES else bin( mask ).count( '1' )
 
-            overlapping_candidates = { candidate for index in overlapping_indices for candidate in candidates[index] }
-            row_exlusive_candidates = { candidate for index in row_exlusive for candidate in candidates[index] }
 
-            for candidate in ( overlapping_candidates - row_exlusive_candidates ):
-                count += remove_candidates( candidate, candidates, box_exlusive )
+def mask_to_values( mask: int ) -> List[int]:
+    """ Return list of values for the bits set in mask. """
+    return [ value for value in range( 1, mask.bit_length() + 1 ) if mask & value_to_bit( value ) ]
 
-    for column in range(1, 10):
-        column_indices = get_column( column, indices )
-        column_candidates = get_column( column, candidates )
 
-        overlapping_boxes = { which_box( index ) for index in column_indices }
+def values_to_mask( values: Iterable[int] ) -> int:
+    """ Return mask with the bits set for given values. """
+    mask = 0
+    for value in values:
+        mask |= value_to_bit( value )
+    return mask
 
-        for box in overlapping_boxes:
 
-            box_indices = get_box( box, indices )
+def get_candidate_masks( problem: List[int] ) -> array:
+    """ Given a problem, returns an array with candidate masks for all cells. """
 
-            overlapping_indices = set( column_indices ) & set( box_indices )
-            box_exlusive = set( box_indices ) - set( column_indices )
-            column_exlusive = set( column_indices ) - set( box_indices )
+    grid = grid_geometry( problem )
+    masks = grid.empty_masks()
+    peers = grid.peers
 
-            overlapping_candidates = { candidate for index in overlapping_indices for candidate in candidates[index] }
-            column_exlusive_candidates = { candidate for index in column_exlusive for candidate in candidates[index] }
+    for index, cell in enumerate(problem):
 
-            for candidate in ( overlapping_candidates - column_exlusive_candidates ):
-                count += remove_candidates( candidate, candidates, box_exlusive )
+        if cell:
+            continue
 
-    return count
+        used = 0
+        for peer in peers[index]:
+            if problem[peer]:
+                used |= value_to_bit( problem[peer] )
 
+        masks[index] = grid.all_candidates & ~used
 
-def hidden_subset( candidates, section_indices, depth ) -> int:
+    return masks
 
-    count = 0
 
-    # remove indices without candidates, ie ones with set value,
-    candidate_indices = [ index for index in section_indices if candidates[index] ]
+def masks_to_candidates( masks: array ) -> List[List[int]]:
+    """ Convert masks to the list of candidates used by get_all_candidates. """
+    return [ mask_to_values( mask ) for mask in masks ]
 
-    # iterate over all combinations of candidate cells in section
-    for subset_indices in combinations(candidate_indices, depth ):
 
-        # get indices for all cells but for the subset
-        other_indices = set(candidate_indices) - set(subset_indices)
+def candidates_to_masks( candidates: List[List[int]] ) -> array:
+    """ Convert list of candidates to an array of masks. """
+    masks = [ values_to_mask( cell ) for cell in candidates ]
+    return array( 'H' if max( masks, default=0 ) <= 0xffff else 'L', masks )
 
-        # all candidates not in the subset of the section
-        other_candidates = { candidate for index in other_indices for candidate in candidates[index] }
 
-        # all candidates in the current subset of section
-        subset_candidates = { candidate for index in subset_indices for candidate in candidates[index] }
+def apply_to_candidates( technique: Callable, candidates: List[List[int]], *args ) -> int:
+    """ Run a technique working on masks against list candidates, updating the lists of
+    changed cells in place. Return what the technique returned. """
 
-        subset = subset_candidates - other_candidates
-        
-        if len(subset) == depth:
-            for value in { x for x in range(1, 10) } - subset:
-                count += remove_candidates( value, candidates, subset_indices )
+    masks = candidates_to_masks( candidates )
+    count = technique( masks, *args )
 
-    return count
+    if count:
+        for cell, mask in zip( candidates, masks ):
+            if values_to_mask( cell ) != mask:
+                cell[:] = mask_to_values( mask )
 
+    return count
 
-def naked_subset( candidates, section_indices, depth ) -> int:
 
+def remove_candidate_masks( bits: int, masks: array, indices: Iterable[int] ) -> int:
+    """ Remove bits from masks for given indices, return number of candidates removed. """
+    # masks may be any run of cells, so only whole grids of other sizes are told apart,
+    counts = _GEOMETRIES_BY_CELLS.get( len( masks ), GEOMETRY ).popcount
     count = 0
-    
-    # remove indices without candidates, ie ones with set value,
-    candidate_indices = [ index for index in section_indices if candidates[index] ]
+    for index in indices:
+        mask = masks[index]
+        if mask & bits:
+            count += counts[ mask & bits ]
+            masks[index] = mask & ~bits
 
-    # iterate over all combinations of candidate cells in section
-    for subset_indices in combinations(candidate_indices, depth):
+    return count
 
-        # get indices for all cells but for the subset
-        other_indices = set(candidate_indices) - set(subset_indices)
 
-        # all candidates in the current subset of section
-        subset_candidates = { candidate for index in subset_indices for candidate in candidates[index] }
+def place( problem: List[int], masks: array, index: int, value: int ) -> int:
+    """ Set value for cell at index, and remove it from the candidates of the 20 peers
+    only, leaving any other eliminations in masks untouched. Return number of
+    candidates removed from the peers. """
 
-        if len(subset_candidates) == depth:
-            for value in subset_candidates:
-                count += remove_candidates( value, candidates, other_indices )
+    problem[index] = value
+    masks[index] = 0
 
-    return count
+    return remove_candidate_masks( value_to_bit( value ), masks, grid_geometry( masks ).peers[index] )
 
 
-def xwing(candidates: List[List[int]]) -> int:
-    count = 0
-    all_indices = [x for x in range(81)]
+def unit_cells( units: Iterable[int] = None, grid: Geometry = GEOMETRY ) -> Iterable[int]:
+    """ Return indices of the cells in given units, by position in UNITS, or all
+    indices if units is None. Cells shared by several units are repeated. """
 
-    # first try xwing on rows,
-    for i in range(1, 9):
-        row = get_row(i, candidates)
-        counter = Counter(chain(*row))
+    if units is None:
+        return grid.indices
 
-        if not 2 in counter.values():
-            continue
+    return [ index for unit in units for index in grid.units[unit] ]
 
-        columns = {k: [] for k,v in counter.items() if v == 2}
-        for fish in columns.keys():
-            # find which columns this fish number belongs to,
-            for column, cell in enumerate(row):
-                if fish not in cell:
-                    continue
-                columns[fish].append(column+1)
 
-        for j in range(i+1, 10):
-            second_row = get_row(j, candidates)
-            counter = Counter(chain(*second_row))
+def solve_naked_singles_masks( problem: List[int], masks: array, units: Iterable[int] = None ) -> int:
+    """ Place the value for any cell with a single candidate in masks. If units are
+    given, by position in UNITS, only their cells are checked. """
 
-            _columns = {k: [] for k,v in counter.items() if v == 2}
+    solved_cells = 0
 
-            shared_fishes = set(columns.keys()).intersection(set(_columns.keys()))
-            if not shared_fishes:
-                # print(f"Row {i} and {j} does not share any fishes.")
-                continue
+    for index in unit_cells( units, grid_geometry( masks ) ):
+        mask = masks[index]
+        if mask and not mask & ( mask - 1 ):
+            place( problem, masks, index, bit_to_value( mask ) )
+            solved_cells += 1
 
-            for fish in _columns.keys():
-                for column, cell in enumerate(second_row, 1):
-                    if fish not in cell:
-                        continue
-                    _columns[fish].append(column)
+    return solved_cells
 
-            for fish in shared_fishes:
-                if not columns.get(fish) == _columns.get(fish):
-                    continue
 
-                c = columns.get(fish)
-                # get the indices for the columns, but exclude the indices for the rows
-                indices = (set(get_column(c[0], all_indices)) | set(get_column(c[1], all_indices))) - (set(get_row(i, all_indices)) | set(get_row(j, all_indices)))
-                count += remove_candidates(fish, candidates, indices)
+def solve_hidden_singles_masks( problem: List[int], masks: array, units: Iterable[int] = None ) -> int:
+    """ For each unit, place the value in cells holding the only occurence of a
+    candidate in the unit. If units are given, by position in UNITS, only those
+    are checked. """
 
-    # same but using columns as base sets,
-    for i in range(1, 9):
-        first_column = get_column(i, candidates)
-        counter = Counter(chain(*first_column))
+    solved_cells = 0
+    all_units = grid_geometry( masks ).units
 
-        if not 2 in counter.values():
-            continue  # skip this row as it does not contain any candidate locked to two cells,
+    for unit in ( all_units if units is None else [ all_units[unit] for unit in units ] ):
 
-        rows = {k: [] for k,v in counter.items() if v == 2}
-        for fish in rows.keys():
-            # find which columns this fish number belongs to,
-            for row, cell in enumerate(first_column):
-                if fish not in cell:
-                    continue
-                rows[fish].append(row+1)
+        # Collect candidates seen at least once, and at least twice,
+        once = twice = 0
+        for index in unit:
+            twice |= once & masks[index]
+            once |= masks[index]
 
-        for j in range(i+1, 10):
-            second_column = get_column(j, candidates)
-            counter = Counter(chain(*second_column))
+        hidden = once & ~twice
 
-            _rows = {k: [] for k,v in counter.items() if v == 2}
+        while hidden:
+            bit = lowest_bit( hidden )
+            hidden ^= bit
 
-            shared_fishes = set(rows.keys()).intersection(set(_rows.keys()))
-            if not shared_fishes:
-                continue
+            for index in unit:
+                if masks[index] & bit:
+                    place( problem, masks, index, bit_to_value( bit ) )
+                    solved_cells += 1
+                    break
 
-            for fish in _rows.keys():
-                for row, cell in enumerate(second_column, 1):
-                    if fish not in cell:
-                        continue
-                    _rows[fish].append(row)
+    return solved_cells
+
+
+def intersections( units: Iterable[int] = None, grid: Geometry = GEOMETRY ) -> Iterable[Tuple]:
+    """ Return entries of INTERSECTIONS where the box or the row/column is one of the
+    given units, by position in UNITS, or all of them if units is None. """
+
+    if units is None:
+        return grid.intersections
+
+    units = set( units )
+
+    return [
+        intersection
+        for intersection, ( box_id, line_id ) in zip( grid.intersections, grid.intersection_unit_ids )
+        if box_id in units or line_id in units
+    ]
 
-            for fish in shared_fishes:
-                if not rows.get(fish) == _rows.get(fish):
-                    continue
 
-                r = rows.get(fish)
+def eliminate_locked_candidates_pointing_masks( masks: array, units: Iterable[int] = None ) -> int:
+    """ Eliminate candidates confined to a row/column inside a box from the rest of the
+    row/column. If units are given, only intersections involving them are checked. """
 
-                # get the indices for the columns, but exclude the indices for the rows
-                indices = (set(get_row(r[0], all_indices)) | set(get_row(r[1], all_indices))) - (set(get_column(i, all_indices)) | set(get_column(j, all_indices)))
-                count += remove_candidates(fish, candidates, indices)
+    count = 0
+
+    for overlap, box_exclusive, line_exclusive in intersections( units, grid_geometry( masks ) ):
+
+        overlap_mask = 0
+        for index in overlap:
+            overlap_mask |= masks[index]
+
+        box_mask = 0
+        for index in box_exclusive:
+            box_mask |= masks[index]
+
+        pointing = overlap_mask & ~box_mask
+        if pointing:
+            count += remove_candidate_masks( pointing, masks, line_exclusive )
 
     return count
 
 
-def solve_problem( problem: List[int] ) -> List[int]:
-    _problem = [ cell for cell in problem ]
-    indices = [x for x in range(81)]
-    candidates = get_all_candidates(_problem)
+def eliminate_locked_candidates_claiming_masks( masks: array, units: Iterable[int] = None ) -> int:
+    """ Eliminate candidates confined to a box inside a row/column from the rest of the
+    box. If units are given, only intersections involving them are checked. """
 
-    candidate_count = sum([len(x) for x in candidates])
+    count = 0
 
-    # while the problem is not solved,
-    # continue any time we solve or eliminate candidates,
-    while 0 in _problem:
-        q = eliminate_locked_candidates_pointing(candidates)
-        if q:
-            continue
+    for overlap, box_exclusive, line_exclusive in intersections( units, grid_geometry( masks ) ):
 
-        if eliminate_locked_candidates_claiming(candidates):
-            # print("Locked claiming")
-            continue
+        overlap_mask = 0
+        for index in overlap:
+            overlap_mask |= masks[index]
 
-        _x = 0
-        for i in range(9):
-            row = get_row(i, indices)
-            for j in range(2, 5):
-                _x += hidden_subset( candidates, row, j )
-                _x += naked_subset( candidates, row, j )
-
-            col = get_row(i, indices)
-            for j in range(2, 5):
-                _x += hidden_subset( candidates, col, j )
-                _x += naked_subset( candidates, col, j )
-
-            box = get_row(i, indices)
-            for j in range(2, 5):
-                _x += hidden_subset( candidates, box, j )
-                _x += naked_subset( candidates, box, j )
-
-        if _x:
-            # print(f"{_x} Subset values")
-            continue
+        line_mask = 0
+        for index in line_exclusive:
+            line_mask |= masks[index]
 
-        if xwing(candidates):
-            print("Removed candidates using xwing!")
-            continue
+        claiming = overlap_mask & ~line_mask
+        if claiming:
+            count += remove_candidate_masks( claiming, masks, box_exclusive )
 
-        if solve_naked_singles(_problem, candidates):
-            candidates = get_all_candidates( _problem )
-            continue
+    return count
 
-        if solve_hidden_singles(_problem, candidates):
-            candidates = get_all_candidates( _problem )
-            continue
 
-        # we have tried all our elimination techniques and can't seem to eliminate any further values,
-        print("Got stuck trying to solve problem")
-        break
+def hidden_subset_masks( masks: array, section_indices: Iterable[int], depth: int ) -> int:
+    """ Find depth candidates confined to depth cells of the section, and remove all other
+    candidates from those cells. Only candidates found in at most depth cells can be part
+    of such a subset, so combinations are made of those candidates rather than cells. """
+
+    count = 0
+    section_indices = list( section_indices )
+
+    # cells holding each candidate, as a bitmask over positions in section_indices
+    positions = {}
+    for offset, index in enumerate( section_indices ):
+        mask = masks[index]
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            positions[bit] = positions.get( bit, 0 ) | 1 << offset
+
+    confined = [ ( bit, cells ) for bit, cells in positions.items() if bin( cells ).count( '1' ) <= depth ]
+
+    for subset in combinations( confined, depth ):
+
+        subset_mask = cells = 0
+        for bit, bit_cells in subset:
+            subset_mask |= bit
+            cells |= bit_cells
+
+        if bin( cells ).count( '1' ) == depth:
+            subset_indices = [ index for offset, index in enumerate( section_indices ) if cells >> offset & 1 ]
+            count += remove_candidate_masks( grid_geometry( masks ).all_candidates & ~subset_mask, masks, subset_indices )
+
+    return count
+
+
+def naked_subset_masks( masks: array, section_indices: Iterable[int], depth: int ) -> int:
+    """ Find depth cells of the section holding only depth candidates between them, and
+    remove those candidates from the other cells. Only cells with at most depth
+    candidates can be part of such a subset, so only those are combined. """
+
+    count = 0
+
+    # remove indices without candidates, ie ones with set value,
+    candidate_indices = [ index for index in section_indices if masks[index] ]
+
+    # a subset covering every cell leaves nothing to eliminate,
+    if len( candidate_indices ) <= depth:
+        return 0
+
+    counts = grid_geometry( masks ).popcount
+    small_indices = [ index for index in candidate_indices if counts[ masks[index] ] <= depth ]
+
+    for subset_indices in combinations( small_indices, depth ):
+
+        subset_mask = 0
+        for index in subset_indices:
+            subset_mask |= masks[index]
+
+        if counts[subset_mask] == depth:
+            other_indices = [ index for index in candidate_indices if index not in subset_indices ]
+            count += remove_candidate_masks( subset_mask, masks, other_indices )
+
+    return count
+
+
+def fish_masks( masks: array, size: int ) -> int:
+    """ For each value, find size rows where it is confined to the same size columns,
+    and remove it from the rest of those columns. Then the same with the roles of rows
+    and columns swapped. Size 2 is an X-Wing, 3 a Swordfish and 4 a Jellyfish.
+
+    The occupancy of each value in every row and column is collected once, as a
+    bitmask of positions, so base and cover sets are matched by mask unions. """
+
+    count = 0
+    grid = grid_geometry( masks )
+    counts = grid.popcount
+    lines = range( grid.size )
+
+    # row_positions[value][row] holds a bit for each column of row where value is a
+    # candidate, and column_positions[value][column] the same for rows of column.
+    row_positions = [ [0] * grid.size for _ in lines ]
+    column_positions = [ [0] * grid.size for _ in lines ]
+
+    for index, mask in enumerate( masks ):
+        row, column = divmod( index, grid.size )
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            value = bit.bit_length() - 1
+            row_positions[value][row] |= 1 << column
+            column_positions[value][column] |= 1 << row
+
+    for value in lines:
+        bit = 1 << value
+
+        for cover_units, positions in ( ( grid.columns, row_positions[value] ), ( grid.rows, column_positions[value] ) ):
+
+            bases = [ base for base in lines if 0 < counts[ positions[base] ] <= size ]
+
+            for subset in combinations( bases, size ):
+
+                covers = 0
+                for base in subset:
+                    covers |= positions[base]
+
+                if counts[covers] != size:
+                    continue
+
+                for cover in lines:
+                    if not covers >> cover & 1:
+                        continue
+
+                    indices = [
+                        index for base, index in enumerate( cover_units[cover] )
+                        if base not in subset
+                    ]
+                    count += remove_candidate_masks( bit, masks, indices )
+
+    return count
+
+
+def xwing_masks( masks: array ) -> int:
+    """ Remove candidates using X-Wings, ie fish of size 2. """
+    return fish_masks( masks, 2 )
+
+
+# Solver state
+#
+# Values and candidates of a grid held in two flat buffers, a bytearray and an array
+# of masks, rather than a list of ints and per-cell lists. A snapshot is two buffer
+# copies whatever the size of the grid, and restoring one copies back in place.
+#
+# Changes can also be recorded on an undo trail and rolled back to a mark, in time
+# proportional to the changes, which is how the search backtracks. Each entry holds
+# the index of a cell above bit 40, its previous value in the byte above bit 32 and
+# its previous mask below, so undoing an entry writes back both.
+TRAIL_MASK = ( 1 << 32 ) - 1
+
+
+class SolverState:
+    """ Values and candidate masks of a problem being solved. Values is a bytearray,
+    which the techniques accept wherever they take a problem, and candidates the
+    masks as returned by get_candidate_masks. Changes made through assign, eliminate
+    and propagate are recorded on the trail, changes made by the techniques or
+    directly on the buffers are not. """
+
+    __slots__ = ( 'values', 'candidates', 'geometry', 'trail' )
+
+    def __init__( self, values: bytearray, candidates: array, geometry: Geometry = None ):
+        self.values = values
+        self.candidates = candidates
+        self.geometry = geometry or grid_geometry( values )
+        self.trail = []
+
+    @classmethod
+    def from_problem( cls, problem: Sequence[int] ) -> 'SolverState':
+        """ Return the state of problem, with the candidates left by its values. """
+        return cls( bytearray( problem ), get_candidate_masks( problem ) )
+
+    def to_problem( self ) -> List[int]:
+        """ Return the values as a list, as taken by the rest of the module. """
+        return list( self.values )
+
+    def copy( self ) -> 'SolverState':
+        """ Return a copy of values and candidates, with an empty trail. """
+        return SolverState( self.values[:], self.candidates[:], self.geometry )
+
+    def snapshot( self ) -> Tuple[bytes, array]:
+        """ Return a copy of the values and candidates, to be given to restore. """
+        return bytes( self.values ), self.candidates[:]
+
+    def restore( self, snapshot: Tuple[bytes, array] ):
+        """ Reset values and candidates in place to those of a snapshot. The trail no
+        longer applies and is cleared. """
+        values, candidates = snapshot
+        self.values[:] = values
+        self.candidates[:] = candidates
+        self.trail.clear()
+
+    def mark( self ) -> int:
+        """ Return the current position of the trail, to be given to undo. """
+        return len( self.trail )
+
+    def undo( self, mark: int ):
+        """ Roll back every change recorded since mark, latest first. """
+
+        trail, values, masks = self.trail, self.values, self.candidates
+
+        entries = trail[mark:]
+        del trail[mark:]
+
+        for entry in reversed( entries ):
+            index = entry >> 40
+            values[index] = entry >> 32 & 0xff
+            masks[index] = entry & TRAIL_MASK
+
+    def update( self, index: int, value: int, mask: int ):
+        """ Set the value and candidates at index, recording the previous ones. Unlike
+        assign the peers are left alone. """
+
+        self.trail.append( index << 40 | self.values[index] << 32 | self.candidates[index] )
+        self.values[index] = value
+        self.candidates[index] = mask
+
+    def eliminate( self, index: int, bits: int ) -> bool:
+        """ Remove bits from the candidates at index. Return True if any were set. """
+
+        mask = self.candidates[index]
+        if not mask & bits:
+            return False
+
+        self.trail.append( index << 40 | mask )
+        self.candidates[index] = mask & ~bits
+        return True
+
+    def assign( self, index: int, value: int ) -> int:
+        """ Set value at index and remove it from the peers, as place does. Return the
+        number of candidates removed from the peers. """
+
+        values, masks, trail = self.values, self.candidates, self.trail
+        bit = value_to_bit( value )
+
+        trail.append( index << 40 | masks[index] )
+        values[index] = value
+        masks[index] = 0
+
+        count = 0
+        for peer in self.geometry.peers[index]:
+            mask = masks[peer]
+            if mask & bit:
+                trail.append( peer << 40 | mask )
+                masks[peer] = mask ^ bit
+                count += 1
+
+        return count
+
+    def place( self, index: int, value: int ) -> int:
+        """ Set value at index and remove it from the peers without recording it on the
+        trail, see place. """
+        return place( self.values, self.candidates, index, value )
+
+    def propagate( self ) -> bool:
+        """ Place singles until there are none left, see propagate. """
+        return propagate( self.values, self.candidates, self.geometry, self.trail )
+
+    @property
+    def solved( self ) -> bool:
+        """ True once every cell holds a value. Does not check the values. """
+        return 0 not in self.values
+
+
+# Search
+#
+# Depth first search used once the logical techniques stall. Each node places naked
+# and hidden singles, then branches on the candidates of the cell with the fewest
+# candidates left (minimum remaining values).
+
+def propagate( problem: List[int], masks: array, grid: Geometry = None, trail: List[int] = None ) -> bool:
+    """ Place naked and hidden singles until there are none left. Return False if a
+    contradiction was found, ie an empty cell or a value in a unit without candidates.
+    The geometry of the grid may be given to save looking it up, and changes are
+    recorded on trail if given, as for SolverState. """
+
+    # This runs at every node of the search, so place() is inlined, and changes are
+    # recorded into a throwaway list when there is no trail rather than testing for
+    # one at every change.
+    grid = grid or grid_geometry( masks )
+    peers = grid.peers
+    all_candidates = grid.all_candidates
+    record = trail.append if trail is not None else [].append
+
+    while True:
+
+        # Place naked singles until there are none left before looking at the units,
+        progress = False
+        for index in grid.indices:
+            if problem[index]:
+                continue
+
+            mask = masks[index]
+            if not mask:
+                return False
+
+            if not mask & ( mask - 1 ):
+                record( index << 40 | mask )
+                problem[index] = mask.bit_length()
+                masks[index] = 0
+                for peer in peers[index]:
+                    peer_mask = masks[peer]
+                    if peer_mask & mask:
+                        record( peer << 40 | peer_mask )
+                        masks[peer] = peer_mask ^ mask
+                progress = True
+
+        if progress:
+            continue
+
+        for unit in grid.units:
+            once = twice = placed = 0
+            for index in unit:
+                mask = masks[index]
+                twice |= once & mask
+                once |= mask
+                if problem[index]:
+                    placed |= 1 << ( problem[index] - 1 )
+
+            if once | placed != all_candidates:
+                return False
+
+            hidden = once & ~twice
+            while hidden:
+                bit = hidden & -hidden
+                hidden ^= bit
+
+                for index in unit:
+                    if masks[index] & bit:
+                        record( index << 40 | masks[index] )
+                        problem[index] = bit.bit_length()
+                        masks[index] = 0
+                        for peer in peers[index]:
+                            peer_mask = masks[peer]
+                            if peer_mask & bit:
+                                record( peer << 40 | peer_mask )
+                                masks[peer] = peer_mask ^ bit
+                        progress = True
+                        break
+                else:
+                    # another hidden single in this unit took the only cell for bit
+                    return False
+
+        if not progress:
+            return True
+
+
+def has_conflicts( problem: List[int] ) -> bool:
+    """ Check if any value is set more than once in a row, column or box. """
+
+    for unit in grid_geometry( problem ).units:
+        values = [ problem[index] for index in unit if problem[index] ]
+        if len( values ) != len( set( values ) ):
+            return True
+
+    return False
+
+
+# The clock and the cancel token are only looked at every so many steps, since a
+# step can take a few microseconds and is_set may be a call to another process.
+BUDGET_CHECK_INTERVAL = 16
+
+
+class BudgetExhausted( Exception ):
+    """ Raised by Budget.spend once the budget is used up. Reason is one of 'max_steps',
+    'deadline' or 'cancelled'. """
+
+    def __init__( self, reason: str ):
+        super().__init__( reason )
+        self.reason = reason
+
+
+class Budget:
+    """ Bound on the work done by solve and iter_solutions. A step is one call of a
+    technique or one node of the search. Deadline is a time as given by perf_counter,
+    and cancel any object with an is_set method, such as threading.Event. """
+
+    __slots__ = ( 'steps', 'max_steps', 'deadline', 'cancel' )
+
+    def __init__( self, max_steps: int = None, deadline: float = None, cancel = None ):
+        self.steps = 0
+        self.max_steps = max_steps
+        self.deadline = deadline
+        self.cancel = cancel
+
+    def spend( self ):
+        """ Count a step, raising BudgetExhausted if there are none left. """
+
+        self.steps += 1
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise BudgetExhausted( 'max_steps' )
+
+        if not self.steps % BUDGET_CHECK_INTERVAL:
+            self.check()
+
+    def check( self ):
+        """ Raise BudgetExhausted if cancelled or past the deadline. """
+
+        if self.cancel is not None and self.cancel.is_set():
+            raise BudgetExhausted( 'cancelled' )
+
+        if self.deadline is not None and perf_counter() >= self.deadline:
+            raise BudgetExhausted( 'deadline' )
+
+
+def iter_solutions( problem: List[int], masks: array = None, budget: Budget = None ) -> Iterator[List[int]]:
+    """ Yield every solution to problem. If masks are given they are used as the
+    candidates of problem, so eliminations made by other techniques carry over.
+    Neither problem nor masks are modified. If a budget is given, a step is spent
+    at every node and BudgetExhausted is raised when it runs out. """
+
+    if has_conflicts( problem ):
+        return
+
+    grid = grid_geometry( problem )
+    masks = get_candidate_masks( problem ) if masks is None else array( grid.typecode, masks )
+    state = SolverState( bytearray( problem ), masks, grid )
+
+    for solution in _search( state, budget ):
+        yield list( solution )
+
+
+def _best_cell( problem: bytearray, masks: array, grid: Geometry ) -> int:
+    """ Return the index of an unsolved cell with the fewest candidates, or -1 if every
+    cell is solved. """
+
+    counts = grid.popcount
+    best = -1
+    best_count = grid.size + 1
+    for index in grid.indices:
+        if problem[index]:
+            continue
+
+        count = counts[ masks[index] ]
+        if count < best_count:
+            best, best_count = index, count
+            if count == 2:
+                break
+
+    return best
+
+
+def _search( state: SolverState, budget: Budget = None ) -> Iterator[bytearray]:
+    """ Recursive part of iter_solutions. Changes to state are recorded on its trail,
+    and each branch is rolled back before trying the next, so branching costs the
+    changes made rather than a copy of the grid. The values of state are yielded
+    for every solution, and left as they are once the search is done. """
+
+    if budget is not None:
+        budget.spend()
+
+    problem, masks, grid = state.values, state.candidates, state.geometry
+    if not propagate( problem, masks, grid, state.trail ):
+        return
+
+    best = _best_cell( problem, masks, grid )
+    if best < 0:
+        yield problem
+        return
+
+    candidates = masks[best]
+    while candidates:
+        bit = lowest_bit( candidates )
+        candidates ^= bit
+
+        mark = state.mark()
+        state.assign( best, bit_to_value( bit ) )
+
+        yield from _search( state, budget )
+
+        state.undo( mark )
+
+
+def is_solved( problem: List[int] ) -> bool:
+    """ Check that every row, column and box of problem holds the values 1 through 9,
+    or through the size of the grid. """
+    grid = grid_geometry( problem )
+    return all( { problem[index] for index in unit } == grid.digits for unit in grid.units )
+
+
+def eliminate_subsets_masks( masks: array, units: Iterable[int] = None ) -> int:
+    """ Run hidden and naked subsets of size 2 to 4 over every unit, or the given units
+    by position in UNITS. """
+
+    count = 0
+    all_units = grid_geometry( masks ).units
+
+    for unit in ( all_units if units is None else [ all_units[unit] for unit in units ] ):
+        for depth in range(2, 5):
+            count += hidden_subset_masks( masks, unit, depth )
+            count += naked_subset_masks( masks, unit, depth )
+
+    return count
+
+
+# Techniques run by solve, cheapest first. Each entry holds the name reported in the
+# stats, a function taking problem, masks and the units to look at (by position in
+# UNITS) which returns the amount of progress made, and whether that progress is
+# cells placed rather than candidates eliminated. The fish look at the whole grid
+# whenever any unit changed.
+TECHNIQUES = (
+    # placing singles updates the masks of the peers, so eliminations from
+    # the techniques below are kept rather than recomputing all candidates.
+    ( 'naked_singles', solve_naked_singles_masks, True ),
+    ( 'hidden_singles', solve_hidden_singles_masks, True ),
+    ( 'locked_candidates_pointing', lambda problem, masks, units: eliminate_locked_candidates_pointing_masks( masks, units ), False ),
+    ( 'locked_candidates_claiming', lambda problem, masks, units: eliminate_locked_candidates_claiming_masks( masks, units ), False ),
+    ( 'subsets', lambda problem, masks, units: eliminate_subsets_masks( masks, units ), False ),
+    ( 'xwing', lambda problem, masks, units: fish_masks( masks, 2 ), False ),
+    ( 'swordfish', lambda problem, masks, units: fish_masks( masks, 3 ), False ),
+    ( 'jellyfish', lambda problem, masks, units: fish_masks( masks, 4 ), False ),
+)
+
+
+@dataclass
+class TechniqueStats:
+    """ Counters for one technique. Calls counts every time the technique ran, and hits
+    the calls that made progress. """
+    calls: int = 0
+    hits: int = 0
+    eliminations: int = 0
+    placements: int = 0
+    time: float = 0.0
+
+
+@dataclass
+class SolveStats:
+    """ Statistics collected by solve. A pass is one run down the list of techniques,
+    ending at the first technique making progress. Techniques skipped because none
+    of their units changed are not counted as calls. """
+    passes: int = 0
+    time: float = 0.0
+    techniques: Dict[str, TechniqueStats] = field( default_factory=dict )
+
+    def record( self, name: str, count: int, places: bool, elapsed: float ):
+        """ Add a call to technique name which made count progress in elapsed seconds. """
+
+        technique = self.techniques.get( name )
+        if technique is None:
+            technique = self.techniques[name] = TechniqueStats()
+
+        technique.calls += 1
+        technique.time += elapsed
+        if count:
+            technique.hits += 1
+            if places:
+                technique.placements += count
+            else:
+                technique.eliminations += count
+
+
+class SolveResult( NamedTuple ):
+    """ Outcome of solve. Stats is only set when requested. Candidates are the masks
+    left for the cells of problem, and reason tells why an unsolved problem was left:
+    'no_solution', or the reason the budget ran out. """
+    problem: List[int]
+    solved: bool
+    stats: Optional[SolveStats]
+    candidates: Optional[array] = None
+    reason: Optional[str] = None
+
+
+def solve( problem: List[int], stats: bool = False, on_step: Callable = None, techniques: Sequence = TECHNIQUES,
+           max_steps: int = None, deadline: float = None, cancel = None, workers: int = None ) -> SolveResult:
+    """ Solve problem with the techniques in TECHNIQUES, and fall back to search once
+    they all stall. Another sequence of techniques in the same format may be given.
+    If workers is given, the search is split over that many processes, see
+    parallel_solutions.
+
+    The work can be bounded by max_steps, a deadline and a cancel token, as described
+    for Budget. Once any of them runs out solve returns the grid and candidates as far
+    as the techniques got, with the reason set, rather than carrying on.
+
+    Techniques are scheduled on dirty units: each technique remembers which units had
+    a cell change since it last ran, and only looks at those. After any change the
+    scheduler goes back to the cheapest technique with dirty units, so expensive
+    techniques only run once the cheap ones have reached a fixpoint.
+
+    If stats is True, calls, progress and time spent are collected per technique. If
+    on_step is given, it is called as on_step( name, count, problem, masks ) after
+    every technique making progress, with the search reported as 'search' and the
+    problem as the bytearray of a SolverState. When neither is used the techniques
+    are called without any timing. """
+
+    state = SolverState.from_problem( problem )
+
+    solve_stats = SolveStats() if stats else None
+    if solve_stats:
+        started = perf_counter()
+
+    budget = None
+    if max_steps is not None or deadline is not None or cancel is not None:
+        budget = Budget( max_steps, deadline, cancel )
+
+    try:
+        if budget is not None:
+            budget.check()
+        reason = _schedule( state, techniques, solve_stats, on_step, budget, workers )
+    except BudgetExhausted as exhausted:
+        reason = exhausted.reason
+
+    if solve_stats:
+        solve_stats.time = perf_counter() - started
+
+    return SolveResult( state.to_problem(), reason is None, solve_stats, state.candidates, reason )
+
+
+def _schedule( state: SolverState, techniques: Sequence, solve_stats: Optional[SolveStats],
+               on_step: Optional[Callable], budget: Optional[Budget], workers: Optional[int] = None ) -> Optional[str]:
+    """ Main loop of solve, modifies state. Returns None once the problem is solved,
+    or 'no_solution'. """
+
+    _problem, masks, grid = state.values, state.candidates, state.geometry
+    observed = solve_stats is not None or on_step is not None
+    all_units = grid.all_units
+    cell_unit_bits = grid.cell_unit_bits
+
+    # units changed since each technique last ran, as a bitmask over UNITS
+    dirty = [ all_units ] * len( techniques )
+
+    # while the problem is not solved,
+    # go back to the cheapest technique any time we solve or eliminate candidates,
+    while 0 in _problem:
+
+        if solve_stats:
+            solve_stats.passes += 1
+
+        for position, ( name, technique, places ) in enumerate( techniques ):
+
+            units = dirty[position]
+            if not units:
+                continue
+
+            if budget is not None:
+                budget.spend()
+
+            dirty[position] = 0
+            units = None if units == all_units else [ unit for unit in range( len( grid.units ) ) if units >> unit & 1 ]
+            before = masks[:]
+
+            if observed:
+                start = perf_counter()
+                count = technique( _problem, masks, units )
+                if solve_stats:
+                    solve_stats.record( name, count, places, perf_counter() - start )
+            else:
+                count = technique( _problem, masks, units )
+
+            if masks == before:
+                continue
+
+            changed = 0
+            for index in grid.indices:
+                if masks[index] != before[index]:
+                    changed |= cell_unit_bits[index]
+
+            for other in range( len( dirty ) ):
+                dirty[other] |= changed
+
+            if on_step is not None:
+                on_step( name, count, _problem, masks )
+            break
+
+        else:
+            # we have tried all our elimination techniques and can't seem to eliminate any further values,
+            # so fall back to search, starting from the candidates we have narrowed down so far.
+            start = perf_counter() if observed else 0.0
+            if workers is None:
+                solution = next( iter_solutions( _problem, masks, budget ), None )
+            else:
+                options = {}
+                if budget is not None:
+                    remaining = budget.max_steps - budget.steps if budget.max_steps is not None else None
+                    options = dict( max_steps=remaining, deadline=budget.deadline, cancel=budget.cancel )
+                solution = next( iter( parallel_solutions( _problem, 1, masks, workers, **options ) ), None )
+
+            if solution is None:
+                return 'no_solution'
+
+            count = _problem.count(0)
+            _problem[:] = solution
+            masks[:] = grid.empty_masks()
+
+            if solve_stats:
+                solve_stats.record( 'search', count, True, perf_counter() - start )
+            if on_step is not None:
+                on_step( 'search', count, _problem, masks )
+
+    return None
+
+
+def solve_problem( problem: List[int], max_steps: int = None, deadline: float = None, cancel = None ) -> List[int]:
+    """ Solve problem and return the solved grid, or the grid as far as it got if the
+    problem has no solution or the budget ran out. See solve for statistics and the
+    reason a problem was left unsolved. """
+    return solve( problem, max_steps=max_steps, deadline=deadline, cancel=cancel ).problem
+
+
+# Hints
+#
+# A Session follows a grid being filled in by hand and gives the next step on request.
+# It keeps the candidates between calls, along with the eliminations found by earlier
+# hints and the units changed since each technique last looked at them, so a hint
+# after a move only runs the techniques over the few units the move touched rather
+# than solving the grid again.
+
+class Hint( NamedTuple ):
+    """ Next step found by Session.hint. Technique is the name as in TECHNIQUES, or
+    'search' when the techniques stall and the value was taken from a solution.
+    Cells are the indices changed by the step, placements the ( index, value ) to
+    fill in and eliminations the ( index, value ) candidates removed. """
+    technique: str
+    cells: Tuple[int, ...]
+    placements: Tuple[Tuple[int, int], ...]
+    eliminations: Tuple[Tuple[int, int], ...]
+
+
+class Session:
+    """ Problem being solved a move at a time. Moves are made with place and erase and
+    rolled back with undo, each recorded on the trail of the state. A hint holds a
+    single placement, which is left for the caller to make, or the eliminations of
+    one technique, which are kept in the candidates so the next hint moves on. """
+
+    def __init__( self, problem: List[int], techniques: Sequence = TECHNIQUES ):
+        self.state = SolverState.from_problem( problem )
+        self.techniques = techniques
+        self.givens = frozenset( index for index, value in enumerate( problem ) if value )
+
+        # trail marks taken before each move, and units changed since each technique
+        # last ran, as a bitmask over UNITS as in solve
+        self.history = []
+        self.dirty = [ self.state.geometry.all_units ] * len( techniques )
+
+    @property
+    def problem( self ) -> List[int]:
+        """ The grid as filled in so far. """
+        return self.state.to_problem()
+
+    @property
+    def candidates( self ) -> array:
+        """ The candidate masks, with the eliminations of earlier hints. """
+        return self.state.candidates
+
+    def _touch( self, mark: int ):
+        """ Make the units of every cell changed since mark dirty for all techniques. """
+
+        cell_unit_bits = self.state.geometry.cell_unit_bits
+        changed = 0
+        for entry in self.state.trail[mark:]:
+            changed |= cell_unit_bits[ entry >> 40 ]
+
+        self.dirty = [ units | changed for units in self.dirty ]
+
+    def place( self, index: int, value: int ):
+        """ Fill in value at index. Raise ValueError if the cell is not empty or a peer
+        already holds value. """
+
+        state = self.state
+        grid = state.geometry
+
+        if state.values[index]:
+            raise ValueError( 'cell %d is not empty' % index )
+        if not 1 <= value <= grid.size:
+            raise ValueError( 'value %d out of range' % value )
+        if any( state.values[peer] == value for peer in grid.peers[index] ):
+            raise ValueError( 'value %d already set in a peer of cell %d' % ( value, index ) )
+
+        mark = state.mark()
+        state.assign( index, value )
+        self.history.append( mark )
+        self._touch( mark )
+
+    def erase( self, index: int ):
+        """ Empty the cell at index. Raise ValueError for givens and empty cells. """
+
+        state = self.state
+        if index in self.givens:
+            raise ValueError( 'cell %d is a given' % index )
+        if not state.values[index]:
+            raise ValueError( 'cell %d is empty' % index )
+
+        # the eliminations of earlier hints may rest on the value erased, so the
+        # candidates go back to those left by the values, and the hints find again
+        # whatever still holds.
+        values = state.values[:]
+        values[index] = 0
+        masks = get_candidate_masks( values )
+
+        mark = state.mark()
+        for cell in state.geometry.indices:
+            if state.values[cell] != values[cell] or state.candidates[cell] != masks[cell]:
+                state.update( cell, values[cell], masks[cell] )
+
+        self.history.append( mark )
+        self._touch( mark )
+
+    def undo( self ):
+        """ Roll back the last move made with place or erase, along with the
+        eliminations of any hint since. Raise IndexError if there is none. """
+
+        if not self.history:
+            raise IndexError( 'no move to undo' )
+
+        mark = self.history.pop()
+        self._touch( mark )
+        self.state.undo( mark )
+
+    def apply( self, hint: Hint ):
+        """ Make the placements of hint. """
+        for index, value in hint.placements:
+            self.place( index, value )
+
+    def hint( self ) -> Optional[Hint]:
+        """ Return the next step, from the cheapest technique making progress on the
+        units changed since it last ran, or from search once they all stall. Return
+        None if the grid is full or has no solution. """
+
+        state = self.state
+        values, masks, grid = state.values, state.candidates, state.geometry
+        all_units = grid.all_units
+
+        if state.solved:
+            return None
+
+        for position, ( name, technique, places ) in enumerate( self.techniques ):
+
+            units = self.dirty[position]
+            if not units:
+                continue
+
+            self.dirty[position] = 0
+            before_values, before = state.snapshot()
+            technique( values, masks, None if units == all_units else [ unit for unit in range( len( grid.units ) ) if units >> unit & 1 ] )
+
+            if masks == before:
+                continue
+
+            changed = [ index for index in grid.indices if masks[index] != before[index] ]
+
+            if places:
+                # singles place every cell they find, only the first is the step, and
+                # the technique will find it again until the caller fills it in.
+                index = next( index for index in changed if values[index] != before_values[index] )
+                value = values[index]
+                values[:] = before_values
+                masks[:] = before
+                self.dirty[position] = units
+                return Hint( name, ( index, ), ( ( index, value ), ), () )
+
+            mark = state.mark()
+            eliminations = []
+            for index in changed:
+                mask = masks[index]
+                masks[index] = before[index]
+                state.update( index, 0, mask )
+                eliminations.extend( ( index, value ) for value in mask_to_values( before[index] & ~mask ) )
+
+            self._touch( mark )
+            return Hint( name, tuple( changed ), (), tuple( eliminations ) )
+
+        solution = next( iter_solutions( values, masks ), None )
+        if solution is None:
+            return None
+
+        index = _best_cell( values, masks, grid )
+        return Hint( 'search', ( index, ), ( ( index, solution[index] ), ), () )
+
+
+# Weight of each step made by a technique when grading, ordered from the easiest to
+# the hardest technique. A step is one call of the technique which made progress.
+TECHNIQUE_WEIGHTS = {
+    'naked_singles': 1,
+    'hidden_singles': 2,
+    'locked_candidates_pointing': 5,
+    'locked_candidates_claiming': 5,
+    'subsets': 10,
+    'xwing': 20,
+    'swordfish': 30,
+    'jellyfish': 40,
+    'search': 100,
+}
+
+# Difficulty of a problem by the hardest technique it needs.
+DIFFICULTIES = {
+    'naked_singles': 'easy',
+    'hidden_singles': 'easy',
+    'locked_candidates_pointing': 'medium',
+    'locked_candidates_claiming': 'medium',
+    'subsets': 'hard',
+    'xwing': 'expert',
+    'swordfish': 'expert',
+    'jellyfish': 'expert',
+    'search': 'extreme',
+}
+
+
+class Grade( NamedTuple ):
+    """ Outcome of grade. Technique is the hardest technique used, or None if there was
+    nothing to solve, and difficulty the band it belongs to in DIFFICULTIES. """
+    technique: Optional[str]
+    difficulty: Optional[str]
+    score: int
+    solved: bool
+    solution: List[int]
+
+
+def grade( problem: List[int] ) -> Grade:
+    """ Solve problem once with statistics, and grade it by the techniques needed. The
+    score adds up the weight in TECHNIQUE_WEIGHTS of every step that made progress.
+    Since solve tries the cheapest techniques first, harder ones only count when the
+    easier ones were stuck. """
+
+    result = solve( problem, stats=True )
+
+    hardest = None
+    score = 0
+
+    for name, stats in result.stats.techniques.items():
+        if not stats.hits:
+            continue
+
+        score += TECHNIQUE_WEIGHTS[name] * stats.hits
+        if hardest is None or TECHNIQUE_WEIGHTS[name] > TECHNIQUE_WEIGHTS[hardest]:
+            hardest = name
+
+    return Grade( hardest, DIFFICULTIES.get( hardest ), score, result.solved, result.problem )
+
+
+class SolutionCache:
+    """ LRU cache of solutions, keyed by the canonical form of problems.
+
+    A problem seen before is answered from a dictionary of exact problems. Otherwise
+    its canonical form is looked up, and a stored solution is mapped back through the
+    inverse of the transform, so any problem equivalent to one solved before is
+    answered without solving it. Problems too symmetric to have a canonical form, see
+    canonical_form, are only cached by their exact values. Each of the two
+    dictionaries holds at most maxsize entries. """
+
+    def __init__( self, maxsize: int = 65536 ):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.canonical_hits = 0
+        self.misses = 0
+        self._exact = OrderedDict()
+        self._canonical = OrderedDict()
+
+    def __len__( self ) -> int:
+        return len( self._canonical )
+
+    @property
+    def hit_rate( self ) -> float:
+        """ Fraction of lookups answered from the cache, exact or canonical. """
+        lookups = self.hits + self.canonical_hits + self.misses
+        return ( self.hits + self.canonical_hits ) / lookups if lookups else 0.0
+
+    def _store( self, entries: OrderedDict, key: bytes, value: bytes ):
+        entries[key] = value
+        entries.move_to_end( key )
+        if len( entries ) > self.maxsize:
+            entries.popitem( last=False )
+
+    def get( self, problem: List[int] ) -> Optional[List[int]]:
+        """ Return the cached solution to problem, or None. """
+        return self._lookup( problem )[0]
+
+    def _lookup( self, problem: List[int] ) -> Tuple[Optional[List[int]], Optional[Tuple]]:
+        """ Return the cached solution to problem or None, and the canonical form of
+        problem when it had to be computed, so solve can pass it on to put. """
+
+        key = bytes( problem )
+        solution = self._exact.get( key )
+        if solution is not None:
+            self._exact.move_to_end( key )
+            self.hits += 1
+            return list( solution ), None
+
+        form = canonical_form( problem )
+        canonical_solution = None if form is None else self._canonical.get( bytes( form[0] ) )
+        if canonical_solution is None:
+            self.misses += 1
+            return None, form
+
+        canonical, cells, digits = form
+        self._canonical.move_to_end( bytes( canonical ) )
+        self.canonical_hits += 1
+
+        inverse = [0] * 10
+        for value, label in enumerate( digits ):
+            inverse[label] = value
+
+        solution = [0] * 81
+        for index, value in zip( cells, canonical_solution ):
+            solution[index] = inverse[value]
+
+        self._store( self._exact, key, bytes( solution ) )
+
+        return solution, form
+
+    def put( self, problem: List[int], solution: List[int] ):
+        """ Store solution to problem. """
+        self._put( problem, solution, canonical_form( problem ) )
+
+    def _put( self, problem: List[int], solution: List[int], form: Optional[Tuple] ):
+        """ Store solution to problem with its canonical form, or by its exact values
+        only if form is None. """
+
+        self._store( self._exact, bytes( problem ), bytes( solution ) )
+
+        if form is not None:
+            canonical, cells, digits = form
+            self._store( self._canonical, bytes( canonical ), bytes( digits[ solution[index] ] for index in cells ) )
+
+    def solve( self, problem: List[int] ) -> List[int]:
+        """ Return the solution to problem from the cache, or solve and store it. Problems
+        without a solution are returned as far as solve_problem got and not stored. """
+
+        solution, form = self._lookup( problem )
+        if solution is not None:
+            return solution
+
+        result = solve( problem )
+        if result.solved:
+            self._put( problem, result.problem, form )
+
+        return result.problem
+
+
+def solve_batch( problems: Iterable[List[int]], max_rounds: int = 81 ) -> 'numpy.ndarray':
+    """ Solve many problems at once with NumPy, and return an (N, 81) uint8 array of
+    solutions. Problems with no solution are returned as far as they got.
+
+    All problems are kept in an (N, 81) grid with an (N, 81) uint16 candidate mask,
+    and every round applies naked singles, hidden singles and locked candidates to
+    all active problems with array operations. Problems drop out of the active set
+    once solved or once a round makes no progress for them, and only those left
+    unsolved are handed to solve() one at a time. Requires numpy. """
+
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError( "solve_batch requires numpy" ) from None
+
+    grid = np.array( problems if isinstance( problems, np.ndarray ) else list( problems ), dtype=np.uint8 ).reshape( -1, 81 )
+    if not len( grid ):
+        return grid
+
+    units = np.array( UNITS )
+    cell_units = np.array( CELL_UNIT_IDS )
+    overlaps = np.array( [ overlap for overlap, _, _ in INTERSECTIONS ] )
+    box_exclusives = np.array( [ box_exclusive for _, box_exclusive, _ in INTERSECTIONS ] )
+    line_exclusives = np.array( [ line_exclusive for _, _, line_exclusive in INTERSECTIONS ] )
+
+    # For each cell, the intersections whose pointing candidates it loses (those with
+    # the cell in the line outside the box) and whose claiming candidates it loses
+    # (the cell in the box outside the line), 4 of each.
+    pointing_sources = np.array( [ [ position for position, ( _, _, line_exclusive ) in enumerate( INTERSECTIONS ) if index in line_exclusive ] for index in INDICES ] )
+    claiming_sources = np.array( [ [ position for position, ( _, box_exclusive, _ ) in enumerate( INTERSECTIONS ) if index in box_exclusive ] for index in INDICES ] )
+
+    single_values = np.zeros( ALL_CANDIDATES + 1, dtype=np.uint8 )
+    single_values[ [ 1 << digit for digit in range(9) ] ] = np.arange( 1, 10 )
+    lowest_values = np.array( [ lowest_bit( mask ).bit_length() for mask in range( ALL_CANDIDATES + 1 ) ], dtype=np.uint8 )
+
+    value_bits = np.array( [0] + [ 1 << digit for digit in range(9) ], dtype=np.uint16 )
+
+    def to_bits( values ):
+        return value_bits[values]
+
+    def unit_or( masks, indices ):
+        # or-ing the columns one at a time is much faster than reduce over a short axis,
+        result = masks[:, indices[..., 0]]
+        for column in range( 1, indices.shape[-1] ):
+            result |= masks[:, indices[..., column]]
+        return result
+
+    def peer_or( masks ):
+        # through the units of each cell, which includes the cell itself, but the
+        # masks of cells holding a value are cleared anyway.
+        return unit_or( unit_or( masks, units ), cell_units )
+
+    # Candidates from the values set in the peers of each empty cell,
+    masks = np.where( grid == 0, ALL_CANDIDATES & ~peer_or( to_bits( grid ) ), 0 ).astype( np.uint16 )
+
+    active = np.flatnonzero( ( grid == 0 ).any( axis=1 ) )
+    stalled = []
+
+    for _ in range( max_rounds ):
+        if not len( active ):
+            break
+
+        values = grid[active]
+        candidates = before = masks[active]
+        empty = values == 0
+
+        # Naked singles,
+        placements = np.where( empty, single_values[candidates], 0 )
+
+        # Hidden singles, per unit the digits held by exactly one cell, then the cells
+        # holding them,
+        cells = candidates[:, units]
+        once = np.zeros_like( cells[:, :, 0] )
+        twice = np.zeros_like( once )
+        for position in range(9):
+            twice |= once & cells[:, :, position]
+            once |= cells[:, :, position]
+
+        hidden = candidates & unit_or( once & ~twice, cell_units )
+        placements = np.where( hidden > 0, lowest_values[hidden], placements )
+
+        # A unit missing a digit, or an empty cell without candidates, is a contradiction.
+        placed = unit_or( to_bits( values ), units ) | once
+        dead = ( placed != ALL_CANDIDATES ).any( axis=1 ) | ( empty & ( candidates == 0 ) ).any( axis=1 )
+
+        values = np.where( placements > 0, placements, values )
+        candidates = np.where( values == 0, candidates & ~peer_or( to_bits( placements ) ), 0 ).astype( np.uint16 )
+
+        # Locked candidates, pointing and claiming,
+        overlap = unit_or( candidates, overlaps )
+        pointing = overlap & ~unit_or( candidates, box_exclusives )
+        claiming = overlap & ~unit_or( candidates, line_exclusives )
+
+        candidates &= ~( unit_or( pointing, pointing_sources ) | unit_or( claiming, claiming_sources ) )
+
+        progress = ( placements > 0 ).any( axis=1 ) | ( candidates != before ).any( axis=1 )
+
+        grid[active] = values
+        masks[active] = candidates
+
+        unsolved = ( values == 0 ).any( axis=1 )
+        stalled.extend( active[ unsolved & ( dead | ~progress ) ] )
+        active = active[ unsolved & progress & ~dead ]
+
+    stalled.extend( active )
+
+    # Simultaneous placements are only safe for problems with a solution, so any
+    # grid that is full but not valid is handed to solve() as well.
+    full = np.flatnonzero( ( grid != 0 ).all( axis=1 ) )
+    bits = to_bits( grid[full] )
+    invalid = full[ ( unit_or( bits, units ) != ALL_CANDIDATES ).any( axis=1 ) ]
+
+    for index in chain( stalled, invalid ):
+        grid[index] = solve( grid[index].tolist() ).problem
+
+    return grid
+
+
+class BatchResult( NamedTuple ):
+    """ Outcome of solving one problem in a batch. Index is the position of the problem
+    in the input, and error describes why solution is None. """
+    index: int
+    solution: Optional[List[int]]
+    error: Optional[str]
+
+
+def _solve_chunk( chunk: List[Tuple[int, Union[str, List[int]]]], timeout: float = None, max_steps: int = None ) -> List[BatchResult]:
+    """ Solve a chunk of indexed problems, catching errors for each problem. Runs in
+    the worker processes of solve_many. """
+
+    results = []
+
+    for index, problem in chunk:
+        try:
+            if isinstance( problem, str ):
+                problem = parse_problem( problem )
+
+            deadline = perf_counter() + timeout if timeout is not None else None
+            result = solve( problem, max_steps=max_steps, deadline=deadline )
+        except Exception as error:
+            results.append( BatchResult( index, None, "{}: {}".format( type(error).__name__, error ) ) )
+            continue
+
+        if result.solved and is_solved( result.problem ):
+            results.append( BatchResult( index, result.problem, None ) )
+        elif result.reason in ( 'deadline', 'max_steps' ):
+            results.append( BatchResult( index, None, "Gave up on problem, {} reached".format( result.reason ) ) )
+        else:
+            results.append( BatchResult( index, None, "Problem has no solution" ) )
+
+    return results
+
+
+def _pool_map( function: Callable, tasks: Iterable, workers: int = None, ordered: bool = True ) -> Iterator:
+    """ Call function on each task over a pool of worker processes, yielding the results.
+
+    Tasks are read lazily, with only a few per worker in flight, and results are
+    yielded in task order, or as they complete if ordered is False. Tasks still
+    queued are cancelled when the caller stops iterating. """
+
+    # Imported here to keep importing the module cheap for single problem use.
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from collections import deque
+    import os
+
+    workers = workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor( workers ) as executor:
+        pending = deque()
+
+        try:
+            for task in chain( tasks, [None] ):
+
+                if task is not None:
+                    pending.append( executor.submit( function, task ) )
+                    if len( pending ) < 2 * workers:
+                        continue
+
+                # Drain results until there is room for the next task, or everything
+                # once the input is exhausted.
+                while pending and ( task is None or len( pending ) >= 2 * workers ):
+                    if ordered:
+                        yield pending.popleft().result()
+                        continue
+
+                    done, _ = wait( pending, return_when=FIRST_COMPLETED )
+                    for future in done:
+                        pending.remove( future )
+                        yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def solve_many( problems: Iterable[Union[str, List[int]]], workers: int = None, chunksize: int = 64, ordered: bool = True,
+                timeout: float = None, max_steps: int = None ) -> Iterator[BatchResult]:
+    """ Solve problems over a pool of worker processes, yielding a BatchResult for each.
+
+    Problems may be lists of 81 numbers or lines of 81 characters, which are then
+    parsed by the workers. They are read lazily in chunks of chunksize, with only a
+    few chunks per worker in flight, so problems can be streamed from a large file.
+    Results are yielded in input order, or as chunks complete if ordered is False.
+    A problem that fails to parse or solve, or takes more than timeout seconds or
+    max_steps steps, is reported in its result and the batch carries on. With
+    workers=1 everything runs in the current process. """
+
+    function = _solve_chunk
+    if timeout is not None or max_steps is not None:
+        function = partial( _solve_chunk, timeout=timeout, max_steps=max_steps )
+
+    return _map_chunks( function, problems, workers, chunksize, ordered )
+
+
+def _map_chunks( function: Callable, problems: Iterable, workers: int, chunksize: int, ordered: bool ) -> Iterator:
+    """ Call function on chunks of indexed problems, in the current process if workers
+    is 1 or over a pool otherwise, and yield the results of every chunk in turn. """
+
+    indexed = enumerate( problems )
+    chunks = iter( lambda: list( islice( indexed, chunksize ) ), [] )
+
+    if workers == 1:
+        for chunk in chunks:
+            yield from function( chunk )
+        return
+
+    for results in _pool_map( function, chunks, workers, ordered ):
+        yield from results
+
+
+class GradeResult( NamedTuple ):
+    """ Outcome of grading one problem in a batch. Index is the position of the problem
+    in the input, and error describes why grade is None. """
+    index: int
+    grade: Optional[Grade]
+    error: Optional[str]
+
+
+def _grade_chunk( chunk: List[Tuple[int, Union[str, List[int]]]] ) -> List[GradeResult]:
+    """ Grade a chunk of indexed problems, catching errors for each problem. Runs in
+    the worker processes of grade_many. """
+
+    results = []
+
+    for index, problem in chunk:
+        try:
+            if isinstance( problem, str ):
+                problem = parse_problem( problem )
+
+            results.append( GradeResult( index, grade( problem ), None ) )
+        except Exception as error:
+            results.append( GradeResult( index, None, "{}: {}".format( type(error).__name__, error ) ) )
+
+    return results
+
+
+def grade_many( problems: Iterable[Union[str, List[int]]], workers: int = None, chunksize: int = 64, ordered: bool = True ) -> Iterator[GradeResult]:
+    """ Grade problems over a pool of worker processes, yielding a GradeResult for each.
+    Problems are read and results yielded as in solve_many. """
+
+    return _map_chunks( _grade_chunk, problems, workers, chunksize, ordered )
+
+
+class GeneratedProblem( NamedTuple ):
+    """ A problem accepted by generate, with its grade. """
+    problem: List[int]
+    clues: int
+    grade: Grade
+
+
+def _generate_task( task: Tuple[int, int, int, int, Optional[frozenset]] ) -> List[GeneratedProblem]:
+    """ Run a number of generation attempts from one seed, returning the problems that
+    land in the requested band. Runs in the worker processes of generate. """
+
+    seed, attempts, min_clues, max_clues, difficulties = task
+    rng = random.Random( seed )
+    accepted = []
+
+    for _ in range( attempts ):
+        problem = reduce( create( rng ), rng, min_clues )
+
+        # Counting clues is free, so problems outside the band are dropped before
+        # paying for a graded solve.
+        clues = 81 - problem.count( 0 )
+        if clues > max_clues:
+            continue
+
+        graded = grade( problem )
+        if difficulties is None or graded.difficulty in difficulties:
+            accepted.append( GeneratedProblem( problem, clues, graded ) )
+
+    return accepted
+
+
+def generate( n: int, min_clues: int = 17, max_clues: int = 81, difficulty: Union[str, Iterable[str]] = None,
+              workers: int = None, seed: int = None, attempts: int = 8, max_tasks: int = None ) -> Iterator[GeneratedProblem]:
+    """ Generate n problems with between min_clues and max_clues clues, graded at the
+    given difficulty, or any of several difficulties, or any difficulty if None.
+
+    Attempts run over a pool of worker processes in tasks of a few attempts each,
+    and accepted problems are yielded as soon as their task is done. Every task seeds
+    its own generator from seed and its task number, and results are taken in task
+    order, so the same seed gives the same problems for any number of workers.
+    Without a seed one is drawn at random. Generation gives up after max_tasks tasks
+    if given, since some bands are rarely or never hit. With workers=1 everything
+    runs in the current process. """
+
+    if n <= 0:
+        return
+
+    if isinstance( difficulty, str ):
+        difficulty = [ difficulty ]
+    difficulties = frozenset( difficulty ) if difficulty is not None else None
+
+    if seed is None:
+        seed = random.getrandbits( 32 )
+
+    def tasks():
+        number = 0
+        while max_tasks is None or number < max_tasks:
+            yield ( seed * 1000003 + number, attempts, min_clues, max_clues, difficulties )
+            number += 1
+
+    if workers == 1:
+        results = map( _generate_task, tasks() )
+    else:
+        results = _pool_map( _generate_task, tasks(), workers )
+
+    try:
+        for accepted in results:
+            for generated in accepted:
+                yield generated
+                n -= 1
+                if not n:
+                    return
+    finally:
+        # Closing the pool cancels the tasks still queued.
+        if hasattr( results, 'close' ):
+            results.close()
+
+
+# Cancel token of the worker processes of parallel_solutions, a multiprocessing
+# Event handed to each worker as it starts.
+_SEARCH_CANCEL = None
+
+
+def _init_search_worker( cancel ):
+    global _SEARCH_CANCEL
+    _SEARCH_CANCEL = cancel
+
+
+def _search_task( task: Tuple[bytes, array, int, Optional[int], Optional[float]] ) -> Tuple[List[List[int]], Optional[str]]:
+    """ Search one subtree for up to limit solutions. Returns the solutions found, and
+    the reason the budget ran out if it did. Runs in the worker processes of
+    parallel_solutions, stopping soon after the shared cancel token is set. """
+
+    values, masks, limit, max_steps, timeout = task
+    deadline = perf_counter() + timeout if timeout is not None else None
+    budget = Budget( max_steps, deadline, _SEARCH_CANCEL )
+    solutions = []
+
+    try:
+        for solution in _search( SolverState( bytearray( values ), masks ), budget ):
+            solutions.append( list( solution ) )
+            if len( solutions ) >= limit:
+                break
+    except BudgetExhausted as exhausted:
+        return solutions, exhausted.reason
+
+    return solutions, None
+
+
+def _split( problem: List[int], masks: array, target: int, solutions: List[List[int]] ) -> List[Tuple[bytes, array]]:
+    """ Expand the top levels of the search tree breadth first, branching on the cell
+    with the fewest candidates, until there are at least target open subtrees or
+    nothing left to branch on. Returns the values and masks of every subtree, and
+    adds any solution found on the way to solutions. """
+
+    grid = grid_geometry( problem )
+    frontier = [ ( bytes( problem ), array( grid.typecode, masks ) ) ]
+
+    while frontier and len( frontier ) < target:
+        expanded = []
+
+        for values, node_masks in frontier:
+            state = SolverState( bytearray( values ), node_masks[:], grid )
+            if not state.propagate():
+                continue
+
+            best = _best_cell( state.values, state.candidates, grid )
+            if best < 0:
+                solutions.append( state.to_problem() )
+                continue
+
+            candidates = state.candidates[best]
+            while candidates:
+                bit = lowest_bit( candidates )
+                candidates ^= bit
+
+                mark = state.mark()
+                state.assign( best, bit_to_value( bit ) )
+                expanded.append( ( bytes( state.values ), state.candidates[:] ) )
+                state.undo( mark )
+
+        # every node was solved or dead, so there is nothing left to hand out,
+        if not expanded:
+            return []
+        frontier = expanded
+
+    return frontier
+
+
+def parallel_solutions( problem: List[int], limit: int = 1, masks: array = None, workers: int = None,
+                        max_steps: int = None, deadline: float = None, cancel = None ) -> List[List[int]]:
+    """ Search for up to limit solutions to problem over a pool of worker processes,
+    for single problems too hard to wait for one search.
+
+    The top levels of the search tree are split into a few subtrees per worker, each
+    searched in a worker. With limit=1 the first solution found wins, otherwise the
+    solutions of all subtrees are gathered, as count_solutions needs. As soon as
+    there are enough, or the budget runs out, the other workers are cancelled
+    through a shared token. Which solution wins is not deterministic when there are
+    several. Budgets are as for solve, with max_steps applying to every subtree,
+    and BudgetExhausted is raised once they run out. With workers=1 the subtrees
+    are searched in the current process. """
+
+    if has_conflicts( problem ):
+        return []
+
+    Budget( None, deadline, cancel ).check()
+
+    masks = get_candidate_masks( problem ) if masks is None else masks
+    solutions = []
+
+    # Imported here to keep importing the module cheap for single problem use.
+    import multiprocessing
+    import os
+    import sys
+
+    limit = limit if limit is not None else sys.maxsize
+    workers = workers or os.cpu_count() or 1
+    subtrees = _split( problem, masks, 4 * workers, solutions )
+
+    if len( solutions ) >= limit or not subtrees:
+        return solutions[:limit]
+
+    if workers == 1:
+        for values, subtree_masks in subtrees:
+            if len( solutions ) >= limit:
+                break
+            budget = Budget( max_steps, deadline, cancel )
+            found = islice( _search( SolverState( bytearray( values ), subtree_masks ), budget ), limit - len( solutions ) )
+            solutions.extend( list( solution ) for solution in found )
+        return solutions[:limit]
+
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+    stop = multiprocessing.Event()
+    reason = None
+
+    with ProcessPoolExecutor( workers, initializer=_init_search_worker, initargs=( stop, ) ) as executor:
+        timeout = deadline - perf_counter() if deadline is not None else None
+        pending = {
+            executor.submit( _search_task, ( values, subtree_masks, limit, max_steps, timeout ) )
+            for values, subtree_masks in subtrees
+        }
+
+        try:
+            while pending and len( solutions ) < limit and reason is None:
+                # wake up now and then to look at the caller's deadline and token,
+                done, pending = wait( pending, timeout=0.01, return_when=FIRST_COMPLETED )
+
+                for future in done:
+                    found, exhausted = future.result()
+                    solutions.extend( found )
+                    reason = reason or exhausted
+
+                if cancel is not None and cancel.is_set():
+                    reason = 'cancelled'
+                elif deadline is not None and perf_counter() >= deadline:
+                    reason = 'deadline'
+        finally:
+            stop.set()
+            for future in pending:
+                future.cancel()
+
+    if len( solutions ) < limit and reason is not None:
+        raise BudgetExhausted( reason )
+
+    return solutions[:limit]
+
+
+FORMATS = ( 'line', 'grid', 'json' )
+
+
+def _read_problems( paths: List[str], positions: Dict[int, Tuple[str, int]] ) -> Iterator[str]:
+    """ Yield the problem lines of every file in paths in turn, reading stdin for '-'
+    or when there are no paths. The file and line number of each problem are kept in
+    positions by index, for the caller to take out as results are reported. """
+
+    import sys
+
+    index = 0
+    for path in paths or [ '-' ]:
+        file_in = sys.stdin if path == '-' else open( path )
+        with file_in:
+            for number, line in iter_lines( file_in ):
+                positions[index] = ( path if path != '-' else '<stdin>', number )
+                index += 1
+                yield line
+
+
+def _print_stats( label: str, count: int, failed: int, started: float, extra: str = '' ):
+    import sys
+
+    elapsed = perf_counter() - started
+    rate = count / elapsed if elapsed else 0.0
+    print( "{}: {} problems, {} failed, {:.3f}s, {:.1f} problems/s{}".format( label, count, failed, elapsed, rate, extra ), file=sys.stderr )
+
+
+def _timed_out( deadline: Optional[float] ) -> bool:
+    return deadline is not None and perf_counter() > deadline
+
+
+def _command_solve( args ) -> int:
+    import json
+    import sys
+
+    started = perf_counter()
+    deadline = started + args.timeout if args.timeout else None
+    positions = {}
+    count = failed = 0
+
+    problems = _read_problems( args.inputs, positions )
+    results = solve_many( problems, workers=args.workers, chunksize=args.chunksize, ordered=not args.unordered,
+                          timeout=args.problem_timeout, max_steps=args.max_steps )
+
+    for result in results:
+        path, number = positions.pop( result.index )
+        count += 1
+
+        if result.error:
+            failed += 1
+            print( "{}:{}: {}".format( path, number, result.error ), file=sys.stderr )
+
+        if args.format == 'json':
+            solution = format_problem( result.solution ) if result.solution else None
+            print( json.dumps( { 'index': result.index, 'solution': solution, 'error': result.error } ) )
+        elif args.format == 'grid':
+            print( format_problem( result.solution, 'grid' ) if result.solution else "\n" * 9 )
+        elif args.unordered:
+            print( result.index + 1, format_problem( result.solution ) if result.solution else "" )
+        else:
+            print( format_problem( result.solution ) if result.solution else "" )
+
+        if _timed_out( deadline ):
+            results.close()
+            print( "timed out after {} problems".format( count ), file=sys.stderr )
+            return 3
+
+    if args.stats:
+        _print_stats( "solve", count, failed, started )
+
+    return 1 if failed else 0
+
+
+def _command_grade( args ) -> int:
+    import json
+    import sys
+
+    started = perf_counter()
+    deadline = started + args.timeout if args.timeout else None
+    positions = {}
+    count = failed = 0
+    difficulties = {}
+
+    problems = _read_problems( args.inputs, positions )
+    results = grade_many( problems, workers=args.workers, chunksize=args.chunksize, ordered=not args.unordered )
+
+    for result in results:
+        path, number = positions.pop( result.index )
+        graded = result.grade
+        count += 1
+
+        if result.error:
+            failed += 1
+            print( "{}:{}: {}".format( path, number, result.error ), file=sys.stderr )
+        else:
+            difficulties[graded.difficulty] = difficulties.get( graded.difficulty, 0 ) + 1
+
+        if args.format == 'json':
+            fields = { 'index': result.index, 'error': result.error }
+            if graded:
+                fields.update( difficulty=graded.difficulty, technique=graded.technique, score=graded.score, solved=graded.solved )
+            print( json.dumps( fields ) )
+        elif graded:
+            print( graded.difficulty, graded.score, graded.technique )
+        else:
+            print()
+
+        if _timed_out( deadline ):
+            results.close()
+            print( "timed out after {} problems".format( count ), file=sys.stderr )
+            return 3
+
+    if args.stats:
+        extra = ''.join( ", {} {}".format( count, name ) for name, count in difficulties.items() )
+        _print_stats( "grade", count, failed, started, extra )
+
+    return 1 if failed else 0
+
+
+def _command_generate( args ) -> int:
+    import json
+    import sys
+
+    started = perf_counter()
+    deadline = started + args.timeout if args.timeout else None
+    count = 0
 
-    return _problem
+    problems = generate( args.count, args.min_clues, args.max_clues, args.difficulty, workers=args.workers, seed=args.seed )
+
+    for generated in problems:
+        count += 1
+
+        if args.format == 'json':
+            graded = generated.grade
+            print( json.dumps( { 'problem': format_problem( generated.problem ), 'clues': generated.clues,
+                                 'difficulty': graded.difficulty, 'technique': graded.technique, 'score': graded.score } ) )
+        else:
+            print( format_problem( generated.problem, args.format ) )
+
+        if _timed_out( deadline ):
+            problems.close()
+            print( "timed out after {} problems".format( count ), file=sys.stderr )
+            return 3
+
+    if args.stats:
+        _print_stats( "generate", count, 0, started )
+
+    return 0
+
+
+def _command_convert( args ) -> int:
+    import sys
+
+    # Binary stores are memory mapped so only text can be streamed, and the direction
+    # is told by the magic number at the start of the input.
+    if args.input != '-':
+        with open( args.input, 'rb' ) as file_in:
+            is_store = file_in.read( len( STORE_MAGIC ) ) == STORE_MAGIC
+    else:
+        is_store = False
+
+    if is_store:
+        with PuzzleStore( args.input ) as store:
+            if args.output == '-':
+                for problem in store:
+                    print( format_problem( problem ) )
+                count = len( store )
+            else:
+                count = save_many( args.output, store )
+    else:
+        if args.output == '-':
+            print( "convert: a binary store cannot be written to stdout", file=sys.stderr )
+            return 2
+
+        positions = {}
+        count = write_store( args.output, map( parse_problem, _read_problems( [ args.input ], positions ) ) )
+
+    if args.stats:
+        print( "convert: {} problems".format( count ), file=sys.stderr )
+
+    return 0
+
+
+def _command_bench( args ) -> int:
+    import json
+
+    positions = {}
+    problems = [ parse_problem( line ) for line in _read_problems( args.inputs, positions ) ]
+    times = []
+
+    for _ in range( args.repeat ):
+        for problem in problems:
+            started = perf_counter()
+            solve( problem )
+            times.append( perf_counter() - started )
+
+    times.sort()
+    total = sum( times )
+    summary = {
+        'problems': len( times ),
+        'total': total,
+        'rate': len( times ) / total if total else 0.0,
+        'mean': total / len( times ) if times else 0.0,
+        'p50': times[ len( times ) // 2 ] if times else 0.0,
+        'p95': times[ min( len( times ) - 1, len( times ) * 95 // 100 ) ] if times else 0.0,
+        'max': times[-1] if times else 0.0,
+    }
+
+    if args.format == 'json':
+        print( json.dumps( summary ) )
+    else:
+        print( "{problems} problems in {total:.3f}s, {rate:.1f} problems/s".format( **summary ) )
+        print( "mean {:.3f}ms, p50 {:.3f}ms, p95 {:.3f}ms, max {:.3f}ms".format(
+            *( 1000 * summary[key] for key in ( 'mean', 'p50', 'p95', 'max' ) ) ) )
+
+    return 0
+
+
+def main( argv: List[str] = None ) -> int:
+    """ Command line interface, run as python -m sudoku with one of the commands solve,
+    grade, generate, convert or bench. Problems are read one per line from the given
+    files, or stdin, and results are written to stdout as they are ready, with
+    errors and statistics on stderr. Returns the exit status, which is 1 if any
+    problem failed and 3 if the run timed out. """
+
+    # Imported here to keep importing the module cheap for library use.
+    import argparse
+    import os
+    import sys
+
+    parser = argparse.ArgumentParser( prog="sudoku", description="Solve, grade, generate and convert sudoku problems." )
+    commands = parser.add_subparsers( dest="command", required=True )
+
+    def add_batch_options( command, formats ):
+        command.add_argument( "-w", "--workers", type=int, default=None, help="number of worker processes, defaults to cpu count" )
+        command.add_argument( "-f", "--format", choices=formats, default='line', help="output format, defaults to line" )
+        command.add_argument( "--timeout", type=float, default=None, help="stop after this many seconds" )
+        command.add_argument( "--stats", action="store_true", help="print throughput statistics on stderr" )
+
+    solve_command = commands.add_parser( "solve", help="solve problems, printing one solution per problem" )
+    solve_command.add_argument( "inputs", nargs="*", help="files with one problem per line, defaults to stdin" )
+    add_batch_options( solve_command, FORMATS )
+    solve_command.add_argument( "--chunksize", type=int, default=64, help="problems sent to a worker at a time" )
+    solve_command.add_argument( "--unordered", action="store_true", help="print results as they complete, prefixed by problem number" )
+    solve_command.add_argument( "--problem-timeout", type=float, default=None, help="give up on a problem after this many seconds" )
+    solve_command.add_argument( "--max-steps", type=int, default=None, help="give up on a problem after this many solver steps" )
+
+    grade_command = commands.add_parser( "grade", help="grade problems, printing difficulty, score and hardest technique" )
+    grade_command.add_argument( "inputs", nargs="*", help="files with one problem per line, defaults to stdin" )
+    add_batch_options( grade_command, ( 'line', 'json' ) )
+    grade_command.add_argument( "--chunksize", type=int, default=16, help="problems sent to a worker at a time" )
+    grade_command.add_argument( "--unordered", action="store_true", help="print results as they complete" )
+
+    generate_command = commands.add_parser( "generate", help="generate problems in a clue and difficulty band" )
+    generate_command.add_argument( "-n", "--count", type=int, default=1, help="number of problems, defaults to 1" )
+    generate_command.add_argument( "--min-clues", type=int, default=17 )
+    generate_command.add_argument( "--max-clues", type=int, default=81 )
+    generate_command.add_argument( "-d", "--difficulty", action="append", choices=sorted( set( DIFFICULTIES.values() ) ),
+                                   help="accepted difficulty, may be repeated, defaults to any" )
+    generate_command.add_argument( "--seed", type=int, default=None )
+    add_batch_options( generate_command, FORMATS )
+
+    convert_command = commands.add_parser( "convert", help="convert between text files and binary stores" )
+    convert_command.add_argument( "input", help="text file, '-' for stdin, or binary store" )
+    convert_command.add_argument( "output", help="binary store for text input, text file or '-' for stdout for store input" )
+    convert_command.add_argument( "--stats", action="store_true", help="print the number of problems on stderr" )
+
+    bench_command = commands.add_parser( "bench", help="time solving problems in the current process" )
+    bench_command.add_argument( "inputs", nargs="*", help="files with one problem per line, defaults to stdin" )
+    bench_command.add_argument( "-r", "--repeat", type=int, default=1, help="times to solve every problem" )
+    bench_command.add_argument( "-f", "--format", choices=( 'line', 'json' ), default='line' )
+
+    args = parser.parse_args( argv )
+    command = {
+        'solve': _command_solve,
+        'grade': _command_grade,
+        'generate': _command_generate,
+        'convert': _command_convert,
+        'bench': _command_bench,
+    }[args.command]
+
+    try:
+        return command( args )
+    except BrokenPipeError:
+        # The reader went away, as with head, so point stdout at nothing to avoid
+        # another error when it is flushed at exit.
+        os.dup2( os.open( os.devnull, os.O_WRONLY ), sys.stdout.fileno() )
+        return 1
+    except ( OSError, ValueError ) as error:
+        print( "{}: {}".format( args.command, error ), file=sys.stderr )
+        return 2
 
 
 if __name__ == "__main__":
-    # load and attempt to solve a problem,
-    problem = load("foo.txt")
-    # problem = load("x.txt")
-    print_problem(problem)
-    solution = solve_problem(problem)
-    print_problem(solution)
+    raise SystemExit( main() )
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+from sudoku import *
+import threading
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class TestBatch( unittest.TestCase ):
+
+    def setUp( self ):
+
+        self.problems = [
+            '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..',
+            '.3.....1...8.9....4..6.8......57694....98352....124...276..519....7.9....95...47.',
+            '123',
+            '11.......................................................................3.......',
+        ]
+
+    def test_parse_problem( self ):
+        problem = parse_problem( self.problems[0] )
+        self.assertEqual( 81, len( problem ) )
+        self.assertEqual( [8, 0, 0], problem[:3] )
+
+    def test_parse_problem_invalid( self ):
+        with self.assertRaises( ValueError ):
+            parse_problem( self.problems[2] )
+
+        with self.assertRaises( ValueError ):
+            parse_problem( 'x' * 81 )
+
+    def test_solve_many_in_process( self ):
+        results = list( solve_many( self.problems, workers=1, chunksize=3 ) )
+
+        self.assertEqual( [0, 1, 2, 3], [ result.index for result in results ] )
+        self.assertTrue( is_solved( results[0].solution ) )
+        self.assertTrue( is_solved( results[1].solution ) )
+        self.assertIsNone( results[2].solution )
+        self.assertIn( "ValueError", results[2].error )
+        self.assertEqual( "Problem has no solution", results[3].error )
+
+    def test_solve_many_in_pool( self ):
+        results = list( solve_many( self.problems * 3, workers=2, chunksize=2 ) )
+
+        self.assertEqual( list( range(12) ), [ result.index for result in results ] )
+        self.assertEqual( 6, sum( 1 for result in results if result.solution ) )
+
+    def test_solve_many_unordered( self ):
+        results = list( solve_many( self.problems * 3, workers=2, chunksize=1, ordered=False ) )
+        self.assertEqual( list( range(12) ), sorted( result.index for result in results ) )
+
+    def test_solve_many_max_steps( self ):
+        results = list( solve_many( self.problems[:2], workers=1, max_steps=3 ) )
+
+        self.assertIsNone( results[0].solution )
+        self.assertIn( 'max_steps', results[0].error )
+
+        results = list( solve_many( self.problems[:2], workers=1, max_steps=100000, timeout=60 ) )
+        self.assertTrue( all( is_solved( result.solution ) for result in results ) )
+
+    def test_parallel_solutions( self ):
+        problem = parse_problem( self.problems[0] )
+
+        solutions = parallel_solutions( problem, workers=2 )
+        self.assertEqual( 1, len( solutions ) )
+        self.assertEqual( solve_problem( problem ), solutions[0] )
+
+        self.assertEqual( solutions, parallel_solutions( problem, limit=2, workers=1 ) )
+        self.assertEqual( 1, count_solutions( problem, workers=2 ) )
+
+    def test_parallel_solutions_aggregates_counts( self ):
+        self.assertEqual( 6, len( parallel_solutions( [0] * 81, limit=6, workers=2 ) ) )
+        self.assertEqual( 6, count_solutions( [0] * 81, limit=6, workers=1 ) )
+        self.assertEqual( [], parallel_solutions( parse_problem( self.problems[3] ), workers=2 ) )
+
+    def test_parallel_solutions_cancelled( self ):
+        cancel = threading.Event()
+        cancel.set()
+
+        with self.assertRaises( BudgetExhausted ):
+            parallel_solutions( parse_problem( self.problems[0] ), workers=2, cancel=cancel )
+
+        result = solve( parse_problem( self.problems[0] ), cancel=cancel, workers=2 )
+        self.assertEqual( 'cancelled', result.reason )
+
+    def test_solve_with_search_workers( self ):
+        result = solve( parse_problem( self.problems[0] ), workers=2 )
+        self.assertTrue( result.solved )
+        self.assertTrue( is_solved( result.problem ) )
+
+    def test_generate_in_process( self ):
+        generated = list( generate( 3, max_clues=30, workers=1, seed=7 ) )
+
+        self.assertEqual( 3, len( generated ) )
+        for problem, clues, graded in generated:
+            self.assertEqual( clues, 81 - problem.count( 0 ) )
+            self.assertLessEqual( clues, 30 )
+            self.assertTrue( graded.solved )
+            self.assertEqual( 1, count_solutions( problem ) )
+
+    def test_generate_difficulty( self ):
+        generated = list( generate( 2, difficulty=['easy', 'medium'], workers=1, seed=1 ) )
+
+        self.assertEqual( 2, len( generated ) )
+        self.assertTrue( all( item.grade.difficulty in ('easy', 'medium') for item in generated ) )
+
+    def test_generate_gives_up( self ):
+        self.assertEqual( [], list( generate( 1, max_clues=17, workers=1, seed=1, attempts=1, max_tasks=2 ) ) )
+
+    def test_generate_seed_is_independent_of_workers( self ):
+        in_process = list( generate( 4, workers=1, seed=11, attempts=2 ) )
+        in_pool = list( generate( 4, workers=2, seed=11, attempts=2 ) )
+
+        self.assertEqual( [ item.problem for item in in_process ], [ item.problem for item in in_pool ] )
+
+    @unittest.skipIf( numpy is None, "numpy is not installed" )
+    def test_solve_batch( self ):
+        problems = [ parse_problem( problem ) for problem in self.problems if len( problem ) == 81 ]
+        solutions = solve_batch( problems * 2 ).tolist()
+
+        self.assertEqual( 6, len( solutions ) )
+        for problem, solution in zip( problems * 2, solutions ):
+            if has_conflicts( problem ):
+                self.assertFalse( is_solved( solution ) )
+            else:
+                self.assertTrue( is_solved( solution ) )
+                self.assertTrue( all( cell == solution[index] for index, cell in enumerate(problem) if cell ) )
+
+    @unittest.skipIf( numpy is None, "numpy is not installed" )
+    def test_solve_batch_singles_only( self ):
+        problem = [int(value) for value in '000000010400000000020000000000050407008000300001090000300400200050100000000806000']
+        solution = solve_batch( [ problem ], max_rounds=81 ).tolist()[0]
+        self.assertEqual( solve_problem( problem ), solution )
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+import random
+from sudoku import *
+import unittest
+
+class TestCache( unittest.TestCase ):
+
+    def setUp( self ):
+        self.problem = parse_problem( '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..' )
+        self.rng = random.Random( 7 )
+
+    def test_canonical_form_transform( self ):
+        canonical, cells, digits = canonical_form( self.problem )
+
+        self.assertEqual( list( range(81) ), sorted( cells ) )
+        self.assertEqual( list( range(10) ), sorted( digits ) )
+        self.assertEqual( canonical, [ digits[ self.problem[index] ] for index in cells ] )
+
+    def test_canonical_form_of_equivalent_problems( self ):
+        canonical = canonical_form( self.problem )[0]
+        for _ in range(10):
+            self.assertEqual( canonical, canonical_form( shuffle( self.problem, self.rng ) )[0] )
+
+    def test_canonical_form_of_symmetric_problems( self ):
+        solution = solve_problem( self.problem )
+        for blanks in ( 0, 1, 3 ):
+            problem = [ 0 if index in range( 0, 81, 27 )[:blanks] else value for index, value in enumerate( solution ) ]
+            forms = [ canonical_form( shuffle( problem, self.rng ) ) for _ in range(5) ]
+            self.assertEqual( [ canonical_form( problem ) ] * 5, forms )
+
+        self.assertIsNone( canonical_form( solution ) )
+        self.assertIsNone( canonical_form( [0] * 81 ) )
+
+    def test_canonical_form_of_different_problems( self ):
+        other = parse_problem( '.3.....1...8.9....4..6.8......57694....98352....124...276..519....7.9....95...47.' )
+        self.assertNotEqual( canonical_form( self.problem )[0], canonical_form( other )[0] )
+
+    def test_cache_maps_solution_back( self ):
+        cache = SolutionCache()
+        solution = cache.solve( self.problem )
+        self.assertEqual( 1, cache.misses )
+
+        self.assertEqual( solution, cache.solve( self.problem ) )
+        self.assertEqual( 1, cache.hits )
+
+        equivalent = shuffle( self.problem, self.rng )
+        mapped = cache.solve( equivalent )
+        self.assertEqual( 1, cache.canonical_hits )
+        self.assertEqual( solve_problem( equivalent ), mapped )
+        self.assertAlmostEqual( 2 / 3, cache.hit_rate )
+
+    def test_cache_without_canonical_form( self ):
+        cache = SolutionCache()
+        problem = solve_problem( self.problem )
+        problem[40] = 0
+
+        self.assertTrue( is_solved( cache.solve( problem ) ) )
+        self.assertEqual( 0, len( cache ) )
+        self.assertEqual( cache.solve( problem ), cache.get( problem ) )
+        self.assertEqual( 2, cache.hits )
+
+    def test_cache_evicts_least_recently_used( self ):
+        cache = SolutionCache( maxsize=1 )
+        cache.solve( self.problem )
+        cache.solve( parse_problem( '.3.....1...8.9....4..6.8......57694....98352....124...276..519....7.9....95...47.' ) )
+
+        self.assertEqual( 1, len( cache ) )
+        self.assertIsNone( cache.get( self.problem ) )
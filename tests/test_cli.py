@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+from sudoku import *
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+
+class TestCLI( unittest.TestCase ):
+
+    def setUp( self ):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join( self.directory.name, 'problems.txt' )
+
+        with open( self.path, 'w' ) as file_out:
+            file_out.write( '# two problems and a broken line\n' )
+            file_out.write( '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..\n' )
+            file_out.write( '123\n' )
+            file_out.write( '.3.....1...8.9....4..6.8......57694....98352....124...276..519....7.9....95...47.\n' )
+
+    def tearDown( self ):
+        self.directory.cleanup()
+
+    def run_main( self, *argv ):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        with contextlib.redirect_stdout( stdout ), contextlib.redirect_stderr( stderr ):
+            status = main( list( argv ) )
+        return status, stdout.getvalue().splitlines(), stderr.getvalue()
+
+    def test_format_problem( self ):
+        problem = [ 1, 0 ] * 40 + [ 9 ]
+        self.assertEqual( '1.' * 40 + '9', format_problem( problem ) )
+        self.assertEqual( 10, len( format_problem( problem, 'grid' ).split( '\n' ) ) )
+
+    def test_solve( self ):
+        status, lines, errors = self.run_main( 'solve', '-w', '1', '--stats', self.path )
+
+        self.assertEqual( 1, status )
+        self.assertEqual( 3, len( lines ) )
+        self.assertTrue( is_solved( parse_problem( lines[0] ) ) )
+        self.assertEqual( '', lines[1] )
+        self.assertIn( 'problems.txt:3: ValueError', errors )
+        self.assertIn( 'solve: 3 problems, 1 failed', errors )
+
+    def test_solve_json( self ):
+        status, lines, _ = self.run_main( 'solve', '-w', '1', '-f', 'json', self.path )
+        results = [ json.loads( line ) for line in lines ]
+
+        self.assertEqual( [0, 1, 2], [ result['index'] for result in results ] )
+        self.assertIsNone( results[1]['solution'] )
+        self.assertIsNone( results[2]['error'] )
+
+    def test_grade( self ):
+        status, lines, _ = self.run_main( 'grade', '-w', '1', self.path )
+
+        difficulty, score, technique = lines[2].split()
+        self.assertIn( difficulty, DIFFICULTIES.values() )
+        self.assertEqual( DIFFICULTIES[technique], difficulty )
+
+    def test_generate( self ):
+        status, lines, _ = self.run_main( 'generate', '-n', '2', '-w', '1', '--seed', '3', '-d', 'easy' )
+
+        self.assertEqual( 0, status )
+        self.assertEqual( 2, len( lines ) )
+        self.assertTrue( all( grade( parse_problem( line ) ).difficulty == 'easy' for line in lines ) )
+
+    def test_convert( self ):
+        store = os.path.join( self.directory.name, 'problems.sdk' )
+        text = os.path.join( self.directory.name, 'copy.txt' )
+
+        with open( self.path, 'w' ) as file_out:
+            file_out.write( '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..\n' )
+
+        self.assertEqual( 0, self.run_main( 'convert', self.path, store )[0] )
+        self.assertEqual( 0, self.run_main( 'convert', store, text )[0] )
+        self.assertEqual( list( iter_load( self.path ) ), list( iter_load( text ) ) )
+
+    def test_convert_rejects_larger_grids( self ):
+        with open( self.path, 'w' ) as file_out:
+            file_out.write( '1234341221434321\n' )
+
+        status, _, errors = self.run_main( 'convert', self.path, os.path.join( self.directory.name, 'problems.sdk' ) )
+        self.assertEqual( 2, status )
+        self.assertIn( '9x9', errors )
+
+    def test_bench( self ):
+        status, lines, _ = self.run_main( 'bench', '-f', 'json', os.devnull )
+        self.assertEqual( 0, json.loads( lines[0] )['problems'] )
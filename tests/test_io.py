@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+from sudoku import *
+import os
+import tempfile
+import unittest
+
+class TestIO( unittest.TestCase ):
+
+    def setUp( self ):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join( self.directory.name, 'problems.txt' )
+
+        self.problems = [
+            [int(value) for value in '800000000003600000070090200050007000000045700000100030001000068008500010090000400'],
+            [int(value) for value in '000000039000001005003050800008090006070002000100400000009080050020000600400700000'],
+        ]
+
+    def tearDown( self ):
+        self.directory.cleanup()
+
+    def test_save_and_load( self ):
+        save( self.path, self.problems[0] )
+        self.assertEqual( self.problems[0], load( self.path ) )
+
+    def test_save_many_and_iter_load( self ):
+        self.assertEqual( 2, save_many( self.path, iter( self.problems ) ) )
+        self.assertEqual( self.problems, list( iter_load( self.path ) ) )
+
+    def test_save_many_larger_grids( self ):
+        problems = [ [ ( index // 16 * 4 + index // 64 + index ) % 16 + 1 if index % 3 else 0 for index in range(256) ], [0] * 16 ]
+
+        self.assertEqual( 2, save_many( self.path, problems ) )
+        self.assertEqual( problems, list( iter_load( self.path ) ) )
+
+        save( self.path, problems[0] )
+        self.assertEqual( problems[0], load( self.path ) )
+
+    def test_iter_load_skips_comments_and_blank_lines( self ):
+        with open( self.path, 'w' ) as file_out:
+            file_out.write( "# corpus\n\n" )
+            file_out.write( "8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..  rating 10\n" )
+
+        self.assertEqual( [ self.problems[0] ], list( iter_load( self.path ) ) )
+
+    def test_iter_load_invalid_line( self ):
+        with open( self.path, 'w' ) as file_out:
+            file_out.write( "8" * 81 + "\n" )
+            file_out.write( "8" * 80 + "x\n" )
+
+        problems = iter_load( self.path )
+        next( problems )
+
+        with self.assertRaisesRegex( ValueError, ":2:" ):
+            next( problems )
+
+    # Binary store
+
+    def test_pack_problem( self ):
+        data = pack_problem( self.problems[0] )
+        self.assertEqual( 41, len( data ) )
+        self.assertEqual( self.problems[0], unpack_problem( data ) )
+
+    def test_store_random_access( self ):
+        problems = self.problems * 3
+        self.assertEqual( 6, write_store( self.path, problems ) )
+
+        with PuzzleStore( self.path ) as store:
+            self.assertEqual( 6, len( store ) )
+            self.assertEqual( problems[4], store[4] )
+            self.assertEqual( problems[-1], store[-1] )
+            self.assertEqual( problems[1:5:2], store[1:5:2] )
+            self.assertEqual( problems, list( store ) )
+
+            with self.assertRaises( IndexError ):
+                store[6]
+
+    def test_store_is_picklable( self ):
+        import pickle
+
+        write_store( self.path, self.problems )
+        with PuzzleStore( self.path ) as store:
+            copy = pickle.loads( pickle.dumps( store ) )
+            self.assertEqual( self.problems[1], copy[1] )
+            copy.close()
+
+    def test_store_rejects_text( self ):
+        save_many( self.path, self.problems )
+        with self.assertRaises( ValueError ):
+            PuzzleStore( self.path )
+
+    def test_store_rejects_other_sizes( self ):
+        with self.assertRaises( ValueError ):
+            pack_problem( [0] * 16 )
+        with self.assertRaisesRegex( ValueError, 'problem 2' ):
+            write_store( self.path, [ self.problems[0], [0] * 256 ] )
+
+    def test_convert_text_and_store( self ):
+        text = os.path.join( self.directory.name, 'out.txt' )
+        save_many( self.path, self.problems )
+
+        binary = os.path.join( self.directory.name, 'problems.bin' )
+        self.assertEqual( 2, text_to_store( self.path, binary ) )
+        self.assertEqual( 16 + 2 * 41, os.path.getsize( binary ) )
+
+        self.assertEqual( 2, store_to_text( binary, text ) )
+        self.assertEqual( self.problems, list( iter_load( text ) ) )
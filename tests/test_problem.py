@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import random
 from itertools import chain
 from sudoku import *
 import unittest
@@ -222,3 +223,87 @@ class TestProblem( unittest.TestCase ):
         ]
         remove_candidates( 8, candidates, [0,1,2] )
         self.assertFalse(8 in chain(*candidates))
+
+    ######################
+    # unit table tests   #
+    ######################
+
+    def test_units_cover_grid( self ):
+        self.assertEqual( 27, len( UNITS ) )
+        for unit in UNITS:
+            self.assertEqual( 9, len( set( unit ) ) )
+
+    def test_boxes_match_get_box( self ):
+        for box in range(1, 10):
+            self.assertEqual( get_box( box, self.problem ), list( BOXES[ box - 1 ] ) )
+
+    def test_peers_of_index_0( self ):
+        self.assertEqual( 20, len( PEERS[0] ) )
+        self.assertEqual( [1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 18, 19, 20, 27, 36, 45, 54, 63, 72], list( PEERS[0] ) )
+
+    def test_intersections( self ):
+        self.assertEqual( 54, len( INTERSECTIONS ) )
+        for overlap, box_exclusive, line_exclusive in INTERSECTIONS:
+            self.assertEqual( 3, len( overlap ) )
+            self.assertEqual( 6, len( box_exclusive ) )
+            self.assertEqual( 6, len( line_exclusive ) )
+
+    def test_geometry_sizes( self ):
+        for box in ( 2, 3, 4, 5 ):
+            grid = geometry( box )
+            size = box * box
+
+            self.assertIs( grid, geometry( box ) )
+            self.assertEqual( size * size, len( grid.indices ) )
+            self.assertEqual( 3 * size, len( grid.units ) )
+            self.assertEqual( 3 * ( size - 1 ) - 2 * ( box - 1 ), len( grid.peers[0] ) )
+            self.assertEqual( 2 * size * box, len( grid.intersections ) )
+            self.assertEqual( 'H' if size <= 16 else 'L', grid.empty_masks().typecode )
+
+        self.assertIs( GEOMETRY, geometry( 3 ) )
+        self.assertIs( geometry( 4 ), grid_geometry( [0] * 256 ) )
+        self.assertEqual( 25, geometry( 5 ).popcount[ geometry( 5 ).all_candidates ] )
+
+        with self.assertRaises( ValueError ):
+            grid_geometry( [0] * 80 )
+
+    def test_geometry_boxes( self ):
+        self.assertEqual( ( ( 0, 1, 4, 5 ), ( 2, 3, 6, 7 ), ( 8, 9, 12, 13 ), ( 10, 11, 14, 15 ) ), geometry( 2 ).boxes )
+        self.assertEqual( ( 1, 2, 3, 4, 5, 8, 12 ), geometry( 2 ).peers[0] )
+
+    def test_mask_helpers( self ):
+        mask = values_to_mask( [2, 5, 9] )
+        self.assertEqual( 0b100010010, mask )
+        self.assertEqual( 3, popcount( mask ) )
+        self.assertEqual( 2, bit_to_value( lowest_bit( mask ) ) )
+        self.assertEqual( [2, 5, 9], mask_to_values( mask ) )
+
+    def test_remove_candidate_masks( self ):
+        masks = candidates_to_masks( [ [], [1,2,6,8,9], [4,6,7,8,9] ] )
+        self.assertEqual( 4, remove_candidate_masks( values_to_mask( [6, 8] ), masks, [0,1,2] ) )
+        self.assertEqual( [ [], [1,2,9], [4,7,9] ], masks_to_candidates( masks ) )
+
+    ##########################
+    # create / shuffle tests #
+    ##########################
+
+    def test_create( self ):
+        for _ in range(10):
+            self.assertTrue( is_solved( create() ) )
+
+    def test_create_is_seeded( self ):
+        self.assertEqual( create( random.Random(1) ), create( random.Random(1) ) )
+
+    def test_create_from_base( self ):
+        base = create()
+        grid = create( random.Random(2), base )
+        self.assertTrue( is_solved( grid ) )
+
+    def test_attempt( self ):
+        self.assertTrue( is_solved( attempt( 1 ) ) )
+
+    def test_shuffle_keeps_clue_count( self ):
+        problem = [ value if index % 3 else 0 for index, value in enumerate( create() ) ]
+        shuffled = shuffle( problem, random.Random(3) )
+        self.assertEqual( problem.count(0), shuffled.count(0) )
+        self.assertFalse( has_conflicts( shuffled ) )
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 from sudoku import *
+import random
+import threading
 import unittest
 
 class TestSolvers( unittest.TestCase ):
@@ -245,3 +247,456 @@ class TestSolvers( unittest.TestCase ):
         candidates = get_all_candidates( self.xwing_columns_problem )
         result = xwing(candidates)
         self.assertEqual(9, result)
+
+    # Bitmask candidate versions of the techniques above
+
+    def test_candidate_masks_match_candidates( self ):
+        masks = get_candidate_masks( self.hidden_quad_problem )
+        candidates = get_all_candidates( self.hidden_quad_problem )
+        self.assertEqual( [ set(cell) for cell in candidates ], [ set(cell) for cell in masks_to_candidates( masks ) ] )
+
+    def test_solve_naked_singles_masks( self ):
+        masks = get_candidate_masks( self.naked_singles_problem )
+        solve_naked_singles_masks( self.naked_singles_problem, masks )
+        self.assertEqual( 6, self.naked_singles_problem[77] )
+
+    def test_solve_hidden_singles_masks( self ):
+        masks = get_candidate_masks( self.hidden_singles_problem )
+        solve_hidden_singles_masks( self.hidden_singles_problem, masks )
+        self.assertEqual( 6, self.hidden_singles_problem[21] )
+
+    def test_eliminate_locked_candidates_pointing_masks( self ):
+        masks = get_candidate_masks( self.locked_candidates_problem_pointing )
+        self.assertTrue( masks[24] & value_to_bit( 5 ) )
+        eliminate_locked_candidates_pointing_masks( masks )
+        self.assertFalse( masks[24] & value_to_bit( 5 ) )
+
+    def test_eliminate_locked_candidates_claiming_masks( self ):
+        masks = get_candidate_masks( self.locked_candidates_problem_claiming )
+        self.assertTrue( masks[3] & value_to_bit( 4 ) )
+        eliminate_locked_candidates_claiming_masks( masks )
+        self.assertFalse( masks[3] & value_to_bit( 4 ) )
+
+    def test_hidden_subset_quad_masks( self ):
+        masks = get_candidate_masks( self.hidden_quad_problem )
+        eliminate_locked_candidates_pointing_masks( masks )
+        eliminate_locked_candidates_claiming_masks( masks )
+        self.assertEqual( values_to_mask( [2, 4, 5, 6, 7, 8, 9] ), masks[8] )
+        hidden_subset_masks( masks, COLUMNS[8], 4 )
+        self.assertFalse( masks[8] & values_to_mask( [6, 7] ) )
+
+    def test_naked_subset_pair_masks( self ):
+        masks = get_candidate_masks( self.naked_subset_pair_problem )
+        cell_index = which_index( row = 8, column = 2 )
+        self.assertEqual( values_to_mask( [3, 7] ), masks[cell_index] )
+        naked_subset_masks( masks, ROWS[7], 2 )
+        self.assertFalse( masks[cell_index] & value_to_bit( 3 ) )
+
+    def test_xwing_rows_masks( self ):
+        masks = get_candidate_masks( self.xwing_rows_problem )
+        self.assertEqual( 1, xwing_masks( masks ) )
+        self.assertFalse( masks[which_index(row=4, column=5)] & value_to_bit( 5 ) )
+
+    def test_xwing_columns_masks( self ):
+        masks = get_candidate_masks( self.xwing_columns_problem )
+        self.assertEqual( 9, xwing_masks( masks ) )
+
+    def test_place_keeps_eliminations( self ):
+        problem = list( self.locked_candidates_problem_pointing )
+        masks = get_candidate_masks( problem )
+        eliminate_locked_candidates_pointing_masks( masks )
+        self.assertFalse( masks[24] & value_to_bit( 5 ) )
+
+        value = bit_to_value( lowest_bit( masks[3] ) )
+        place( problem, masks, 3, value )
+
+        self.assertEqual( value, problem[3] )
+        self.assertEqual( 0, masks[3] )
+        self.assertFalse( masks[24] & value_to_bit( 5 ) )
+        for peer in PEERS[3]:
+            self.assertFalse( masks[peer] & value_to_bit( value ) )
+
+    # Search fallback
+
+    def test_solve_problem_falls_back_to_search( self ):
+        # Known to stall all the logical techniques,
+        problem = [int(value) for value in '800000000003600000070090200050007000000045700000100030001000068008500010090000400']
+        solution = solve_problem( problem )
+        self.assertTrue( is_solved( solution ) )
+        self.assertTrue( all( cell == solution[index] for index, cell in enumerate(problem) if cell ) )
+
+    def test_iter_solutions_without_solution( self ):
+        problem = [0] * 81
+        problem[0] = problem[1] = 1
+        self.assertEqual( [], list( iter_solutions( problem ) ) )
+
+    def test_iter_solutions_keeps_input( self ):
+        problem = list( self.hidden_quad_problem )
+        masks = get_candidate_masks( problem )
+        solutions = list( iter_solutions( problem, masks ) )
+        self.assertEqual( 1, len( solutions ) )
+        self.assertEqual( self.hidden_quad_problem, problem )
+        self.assertEqual( get_candidate_masks( problem ), masks )
+
+    # Solver state
+
+    def test_solver_state_conversions( self ):
+        state = SolverState.from_problem( self.hidden_quad_problem )
+
+        self.assertIsInstance( state.values, bytearray )
+        self.assertEqual( self.hidden_quad_problem, state.to_problem() )
+        self.assertEqual( get_candidate_masks( self.hidden_quad_problem ), state.candidates )
+        self.assertIs( GEOMETRY, state.geometry )
+        self.assertFalse( state.solved )
+
+    def test_solver_state_snapshot_and_restore( self ):
+        state = SolverState.from_problem( self.hidden_quad_problem )
+        copy = state.copy()
+        snapshot = state.snapshot()
+
+        index = state.to_problem().index( 0 )
+        state.place( index, bit_to_value( lowest_bit( state.candidates[index] ) ) )
+        state.propagate()
+        self.assertNotEqual( copy.to_problem(), state.to_problem() )
+
+        values, candidates = state.values, state.candidates
+        state.restore( snapshot )
+
+        self.assertIs( values, state.values )
+        self.assertIs( candidates, state.candidates )
+        self.assertEqual( copy.values, state.values )
+        self.assertEqual( copy.candidates, state.candidates )
+
+    def test_solver_state_place( self ):
+        state = SolverState.from_problem( [0] * 81 )
+        self.assertEqual( 20, state.place( 0, 5 ) )
+        self.assertEqual( 5, state.values[0] )
+        self.assertFalse( state.candidates[1] & value_to_bit( 5 ) )
+
+    def test_solver_state_undo( self ):
+        state = SolverState.from_problem( self.hidden_quad_problem )
+        snapshot = state.snapshot()
+        mark = state.mark()
+
+        index = state.to_problem().index( 0 )
+        value = bit_to_value( lowest_bit( state.candidates[index] ) )
+        removed = state.assign( index, value )
+
+        self.assertEqual( value, state.values[index] )
+        self.assertEqual( removed + 1, len( state.trail ) - mark )
+
+        inner = state.mark()
+        other = state.to_problem().index( 0 )
+        self.assertTrue( state.eliminate( other, lowest_bit( state.candidates[other] ) ) )
+        self.assertFalse( state.eliminate( other, 0 ) )
+        state.propagate()
+        state.undo( inner )
+        self.assertEqual( inner, len( state.trail ) )
+        self.assertEqual( value, state.values[index] )
+
+        state.undo( mark )
+        self.assertEqual( snapshot, state.snapshot() )
+        self.assertEqual( [], state.trail )
+
+    # Session
+
+    def test_session_hints_solve_problem( self ):
+        session = Session( self.hidden_quad_problem )
+        techniques = set()
+
+        hint = session.hint()
+        while hint is not None:
+            techniques.add( hint.technique )
+            if hint.placements:
+                self.assertEqual( 1, len( hint.placements ) )
+            else:
+                for index, value in hint.eliminations:
+                    self.assertFalse( session.candidates[index] & value_to_bit( value ) )
+            session.apply( hint )
+            hint = session.hint()
+
+        self.assertEqual( solve_problem( self.hidden_quad_problem ), session.problem )
+        self.assertIn( 'naked_singles', techniques )
+        self.assertIn( 'subsets', techniques )
+
+    def test_session_hint_follows_moves( self ):
+        session = Session( self.naked_singles_problem )
+        hint = session.hint()
+        index, value = hint.placements[0]
+
+        self.assertEqual( hint, session.hint() )
+        session.place( index, value )
+        self.assertNotEqual( index, session.hint().placements[0][0] )
+
+    def test_session_erase_and_undo( self ):
+        session = Session( self.hidden_quad_problem )
+        start = session.state.snapshot()
+
+        # eliminations from hints stay until a move is undone or a cell erased
+        hint = session.hint()
+        while not hint.eliminations:
+            session.apply( hint )
+            hint = session.hint()
+        placed = session.problem
+        index, _ = hint.eliminations[0]
+        session.place( index, bit_to_value( lowest_bit( session.candidates[index] ) ) )
+
+        filled = session.state.snapshot()
+        session.erase( index )
+        self.assertEqual( get_candidate_masks( placed ), session.candidates )
+        session.undo()
+        self.assertEqual( filled, session.state.snapshot() )
+
+        # eliminations found before any move are kept, they only rest on the givens
+        while session.history:
+            session.undo()
+        values, masks = session.state.snapshot()
+        self.assertEqual( start[0], values )
+        self.assertTrue( all( mask & ~old == 0 for mask, old in zip( masks, start[1] ) ) )
+        self.assertRaises( IndexError, session.undo )
+
+    def test_session_invalid_moves( self ):
+        session = Session( self.naked_singles_problem )
+        empty = self.naked_singles_problem.index( 0 )
+        peer = next( index for index in PEERS[empty] if self.naked_singles_problem[index] )
+
+        self.assertRaises( ValueError, session.place, 0, 1 )
+        self.assertRaises( ValueError, session.place, empty, self.naked_singles_problem[peer] )
+        self.assertRaises( ValueError, session.erase, 0 )
+        self.assertRaises( ValueError, session.erase, empty )
+
+    # Budget
+
+    def test_solve_max_steps( self ):
+        problem = [int(value) for value in '800000000003600000070090200050007000000045700000100030001000068008500010090000400']
+        result = solve( problem, max_steps=3 )
+
+        self.assertFalse( result.solved )
+        self.assertEqual( 'max_steps', result.reason )
+        self.assertEqual( get_candidate_masks( problem ), result.candidates )
+        self.assertIsNone( solve( problem, max_steps=100000 ).reason )
+
+    def test_solve_deadline_and_cancel( self ):
+        problem = [int(value) for value in '800000000003600000070090200050007000000045700000100030001000068008500010090000400']
+        self.assertEqual( 'deadline', solve( problem, deadline=perf_counter() ).reason )
+
+        cancel = threading.Event()
+        cancel.set()
+        result = solve( problem, cancel=cancel )
+        self.assertEqual( 'cancelled', result.reason )
+        self.assertEqual( problem, result.problem )
+
+    def test_solve_reports_no_solution( self ):
+        problem = [0] * 81
+        problem[0] = problem[1] = 1
+        self.assertEqual( 'no_solution', solve( problem ).reason )
+
+    def test_iter_solutions_budget( self ):
+        budget = Budget( max_steps=10 )
+        with self.assertRaises( BudgetExhausted ):
+            list( iter_solutions( [0] * 81, budget=budget ) )
+        self.assertEqual( 11, budget.steps )
+
+    # Other sizes
+
+    def pattern_grid( self, box ):
+        # rows shifted by box within a band and by one between bands,
+        size = box * box
+        return [ ( box * ( row % box ) + row // box + column ) % size + 1 for row in range( size ) for column in range( size ) ]
+
+    def test_solve_4x4( self ):
+        problem = parse_problem( '1...' '..2.' '.3..' '...4' )
+        result = solve( problem )
+
+        self.assertTrue( result.solved )
+        self.assertTrue( is_solved( result.problem ) )
+        self.assertEqual( 1, count_solutions( problem ) )
+
+    def test_solve_16x16( self ):
+        solution = self.pattern_grid( 4 )
+        problem = [ 0 if index % 3 else value for index, value in enumerate( solution ) ]
+
+        self.assertTrue( is_solved( solution ) )
+        self.assertEqual( problem, parse_problem( format_problem( problem ) ) )
+
+        result = solve( problem, stats=True )
+        self.assertTrue( result.solved )
+        self.assertTrue( is_solved( result.problem ) )
+        self.assertTrue( all( cell == result.problem[index] for index, cell in enumerate( problem ) if cell ) )
+        self.assertEqual( 'H', result.candidates.typecode )
+
+    def test_solve_25x25( self ):
+        solution = self.pattern_grid( 5 )
+        problem = [ 0 if index % 2 else value for index, value in enumerate( solution ) ]
+
+        result = solve( problem )
+        self.assertTrue( result.solved )
+        self.assertTrue( is_solved( result.problem ) )
+        self.assertEqual( 'L', result.candidates.typecode )
+
+    def test_techniques_16x16( self ):
+        masks = get_candidate_masks( [0] * 256 )
+        self.assertEqual( 0xffff, masks[0] )
+
+        # confine 16 to two rows in the same two columns, an X-Wing,
+        for row in ( 0, 5 ):
+            for column in range( 2, 16 ):
+                masks[ row * 16 + column ] &= ~value_to_bit( 16 )
+
+        self.assertEqual( 28, xwing_masks( masks ) )
+        self.assertFalse( masks[ 2 * 16 ] & value_to_bit( 16 ) )
+        self.assertTrue( masks[ 5 * 16 + 1 ] & value_to_bit( 16 ) )
+
+    # Uniqueness
+
+    def test_count_solutions( self ):
+        self.assertEqual( 1, count_solutions( self.hidden_quad_problem ) )
+        self.assertEqual( 2, count_solutions( [0] * 81 ) )
+        self.assertEqual( 5, count_solutions( [0] * 81, limit=5 ) )
+
+    def test_is_ambiguous( self ):
+        self.assertFalse( is_ambiguous( self.hidden_quad_problem ) )
+
+        problem = list( self.hidden_quad_problem )
+        problem[1] = problem[7] = 0
+        self.assertTrue( is_ambiguous( problem ) )
+
+        self.assertFalse( is_ambiguous( parse_problem( '1.....2..3.....4' ) ) )
+        self.assertTrue( is_ambiguous( parse_problem( '1.....2.........' ) ) )
+
+    def test_reduce( self ):
+        solution = solve_problem( self.hidden_quad_problem )
+        problem = reduce( solution )
+
+        self.assertEqual( 1, count_solutions( problem ) )
+        self.assertTrue( all( cell == solution[index] for index, cell in enumerate(problem) if cell ) )
+
+        # every remaining value is needed,
+        for index in range(81):
+            if problem[index]:
+                self.assertTrue( is_ambiguous( problem[:index] + [0] + problem[index + 1:] ) )
+
+    def test_reduce_min_clues( self ):
+        solution = solve_problem( self.hidden_quad_problem )
+        problem = reduce( solution, random.Random( 3 ), min_clues=40 )
+
+        self.assertEqual( 40, 81 - problem.count( 0 ) )
+        self.assertEqual( 1, count_solutions( problem ) )
+        self.assertEqual( problem, reduce( solution, random.Random( 3 ), min_clues=40 ) )
+
+    # Statistics
+
+    def test_solve_without_stats( self ):
+        result = solve( self.naked_singles_problem )
+        self.assertTrue( result.solved )
+        self.assertIsNone( result.stats )
+        self.assertEqual( result.problem, solve_problem( self.naked_singles_problem ) )
+
+    def test_solve_stats( self ):
+        result = solve( self.naked_singles_problem, stats=True )
+        stats = result.stats
+
+        self.assertTrue( result.solved )
+        self.assertGreater( stats.passes, 0 )
+        self.assertGreater( stats.time, 0 )
+
+        placed = sum( technique.placements for technique in stats.techniques.values() )
+        self.assertEqual( self.naked_singles_problem.count(0), placed )
+
+    def test_solve_on_step( self ):
+        steps = []
+        result = solve( self.naked_singles_problem, on_step=lambda name, count, problem, masks: steps.append( ( name, count ) ) )
+
+        self.assertTrue( result.solved )
+        self.assertTrue( steps )
+        self.assertTrue( all( count > 0 for _, count in steps ) )
+
+    # Scheduling on dirty units
+
+    def test_solve_hidden_singles_masks_in_units( self ):
+        masks = get_candidate_masks( self.hidden_singles_problem )
+        problem = list( self.hidden_singles_problem )
+
+        # Cell 21 is not in the first row, nor the first column,
+        solve_hidden_singles_masks( problem, masks, [0, 9] )
+        self.assertEqual( 0, problem[21] )
+
+        # but 6 is a hidden single for it in the third row.
+        solve_hidden_singles_masks( problem, masks, [2] )
+        self.assertEqual( 6, problem[21] )
+
+    def test_intersections_for_units( self ):
+        # The first box crosses three rows and three columns,
+        self.assertEqual( 6, len( intersections( [18] ) ) )
+        # while the first row crosses three boxes.
+        self.assertEqual( 3, len( intersections( [0] ) ) )
+
+    def test_solve_skips_expensive_techniques( self ):
+        stats = solve( self.naked_singles_problem, stats=True ).stats
+        self.assertNotIn( 'xwing', stats.techniques )
+        self.assertNotIn( 'subsets', stats.techniques )
+
+    def test_subsets_in_columns_and_boxes( self ):
+        # The hidden quad is in a column and the hidden triple in a box, neither
+        # should need the search.
+        for problem in ( self.hidden_quad_problem, self.hidden_triple_problem ):
+            result = solve( problem, stats=True )
+            self.assertTrue( result.solved )
+            self.assertNotIn( 'search', result.stats.techniques )
+
+    def test_eliminate_subsets_masks_in_units( self ):
+        masks = get_candidate_masks( self.hidden_pair_problem )
+        self.assertTrue( masks[44] & value_to_bit( 6 ) )
+
+        # Column 9 holds the hidden pair,
+        eliminate_subsets_masks( masks, [0, 1] )
+        self.assertTrue( masks[44] & value_to_bit( 6 ) )
+
+        eliminate_subsets_masks( masks, [17] )
+        self.assertFalse( masks[44] & value_to_bit( 6 ) )
+
+    def test_swordfish_masks( self ):
+        # Value 1 confined to columns 1, 5 and 9 in rows 1, 4 and 7, while every other
+        # row has it in those columns and column 3.
+        bit = value_to_bit( 1 )
+        masks = array( 'H', [0] * 81 )
+        for row, columns in ( ( 1, ( 1, 5 ) ), ( 4, ( 5, 9 ) ), ( 7, ( 1, 9 ) ) ):
+            for column in columns:
+                masks[ which_index( row, column ) ] = bit
+        for row in ( 2, 3, 5, 6, 8, 9 ):
+            for column in ( 1, 3, 5, 9 ):
+                masks[ which_index( row, column ) ] = bit
+
+        self.assertEqual( 0, fish_masks( masks, 2 ) )
+        self.assertEqual( 18, fish_masks( masks, 3 ) )
+        self.assertEqual( bit, masks[ which_index( 2, 3 ) ] )
+        self.assertEqual( 0, masks[ which_index( 2, 1 ) ] )
+        self.assertEqual( bit, masks[ which_index( 4, 5 ) ] )
+
+    # Grading
+
+    def test_grade_easy( self ):
+        result = grade( self.naked_singles_problem )
+        self.assertEqual( 'easy', result.difficulty )
+        self.assertTrue( result.solved )
+        self.assertEqual( solve_problem( self.naked_singles_problem ), result.solution )
+
+    def test_grade_subsets( self ):
+        result = grade( self.hidden_quad_problem )
+        self.assertEqual( 'subsets', result.technique )
+        self.assertEqual( 'hard', result.difficulty )
+
+    def test_grade_xwing( self ):
+        result = grade( self.xwing_rows_problem )
+        self.assertEqual( 'xwing', result.technique )
+        self.assertEqual( 'expert', result.difficulty )
+
+    def test_grade_search_scores_highest( self ):
+        problem = [int(value) for value in '800000000003600000070090200050007000000045700000100030001000068008500010090000400']
+        result = grade( problem )
+        self.assertEqual( 'extreme', result.difficulty )
+        self.assertGreater( result.score, grade( self.hidden_quad_problem ).score )
+
+    def test_grade_solved_problem( self ):
+        solution = solve_problem( self.naked_singles_problem )
+        self.assertEqual( ( None, None, 0 ), grade( solution )[:3] )